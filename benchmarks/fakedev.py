@@ -0,0 +1,56 @@
+import os
+import struct
+import warnings
+
+from xbox360controller import Xbox360Controller
+from xbox360controller.controller import JS_EVENT_FORMAT
+from xbox360controller.linux.joystick import JS_EVENT_AXIS, JS_EVENT_BUTTON
+
+
+class FakeDevice:
+    """A pipe standing in for a joystick device, /dev/null for the event file."""
+
+    def __init__(self):
+        self._read_fd, self._write_fd = os.pipe()
+
+    def controller(self, index=0, **kwargs):
+        with warnings.catch_warnings():
+            # There is no LED
+            warnings.simplefilter("ignore")
+            return Xbox360Controller(
+                index,
+                device=os.fdopen(self._read_fd, "rb", buffering=0),
+                event_device=os.devnull,
+                **kwargs
+            )
+
+    def write(self, data):
+        os.write(self._write_fd, data)
+
+    def close(self):
+        os.close(self._write_fd)
+
+
+def js_events(*events):
+    return b"".join(
+        struct.pack(JS_EVENT_FORMAT, time_ms, value, type_, number)
+        for time_ms, value, type_, number in events
+    )
+
+
+def burst(time_ms, value):
+    """Both sticks, both triggers and a button changing at the same time."""
+    return js_events(
+        *(
+            (time_ms, value, type_, number)
+            for type_, number in (
+                (JS_EVENT_AXIS, 0),
+                (JS_EVENT_AXIS, 1),
+                (JS_EVENT_AXIS, 2),
+                (JS_EVENT_AXIS, 3),
+                (JS_EVENT_AXIS, 4),
+                (JS_EVENT_AXIS, 5),
+                (JS_EVENT_BUTTON, 0),
+            )
+        )
+    )
@@ -0,0 +1,228 @@
+"""Events per second through Xbox360Controller.process_events.
+
+Compares the dispatch tables with the chain of comparisons used before, run
+against copies of the original axis and button classes.
+
+Usage: python -m benchmarks.process_event [events]
+"""
+
+import struct
+import sys
+import time
+
+from benchmarks.fakedev import FakeDevice, burst
+from xbox360controller.controller import (
+    BOOT_TIME,
+    JS_EVENT_FORMAT,
+    ControllerEvent,
+)
+from xbox360controller.linux.joystick import JS_EVENT_AXIS, JS_EVENT_BUTTON
+
+
+class RawAxis:
+    def __init__(self, name):
+        self.name = name
+        self._value = 0
+        self.when_moved = None
+
+    @property
+    def value(self):
+        return self._value
+
+
+class Axis:
+    def __init__(self, name):
+        self.name = name
+        self._value_x = 0
+        self._value_y = 0
+        self.when_moved = None
+
+    @property
+    def x(self):
+        return self._value_x
+
+    @property
+    def y(self):
+        return self._value_y
+
+
+class Button:
+    def __init__(self, name):
+        self.name = name
+        self._value = False
+        self.when_pressed = None
+        self.when_released = None
+
+    @property
+    def is_pressed(self):
+        return bool(self._value)
+
+
+class LegacyController:
+    """The axes, buttons and event processing of the controller before the
+    dispatch tables, with plain attributes and no state store."""
+
+    def __init__(self, axis_threshold=0.2):
+        self.axis_threshold = axis_threshold
+        self.axis_l = Axis("axis_l")
+        self.axis_r = Axis("axis_r")
+        self.hat = Axis("hat")
+        self.trigger_l = RawAxis("trigger_l")
+        self.trigger_r = RawAxis("trigger_r")
+        self.buttons = [
+            Button(name)
+            for name in (
+                "button_a",
+                "button_b",
+                "button_x",
+                "button_y",
+                "button_trigger_l",
+                "button_trigger_r",
+                "button_select",
+                "button_start",
+                "button_mode",
+                "button_thumb_l",
+                "button_thumb_r",
+            )
+        ]
+        self.button_a = self.buttons[0]
+
+    def axis_callback(self, axis, val):
+        if (
+            axis.when_moved is not None
+            and abs(val) > self.axis_threshold
+            and callable(axis.when_moved)
+        ):
+            axis.when_moved(axis)
+
+    def process_event(self, event):
+        if event.type == JS_EVENT_BUTTON:
+
+            if event.number >= 11 and event.number <= 14:
+                if event.number == 11:
+                    self.hat._value_x = -int(event.value)
+                    val = self.hat._value_x
+                if event.number == 12:
+                    self.hat._value_x = int(event.value)
+                    val = self.hat._value_x
+                if event.number == 13:
+                    self.hat._value_y = int(event.value)
+                    val = self.hat._value_y
+                if event.number == 14:
+                    self.hat._value_y = -int(event.value)
+                    val = self.hat._value_y
+
+                self.axis_callback(self.hat, val)
+
+            try:
+                button = self.buttons[event.number]
+            except IndexError:
+                return
+            else:
+                button._value = event.value
+
+                if (
+                    button._value
+                    and button.when_pressed is not None
+                    and callable(button.when_pressed)
+                ):
+                    button.when_pressed(button)
+
+                if (
+                    not button._value
+                    and button.when_released is not None
+                    and callable(button.when_released)
+                ):
+                    button.when_released(button)
+
+        if event.type == JS_EVENT_AXIS:
+            num = event.number
+            val = event.value / 32767
+
+            if num == 0:
+                self.axis_l._value_x = val
+            if num == 1:
+                self.axis_l._value_y = val
+            if num == 2:
+                self.trigger_l._value = (val + 1) / 2
+            if num == 3:
+                self.axis_r._value_x = val
+            if num == 4:
+                self.axis_r._value_y = val
+            if num == 5:
+                self.trigger_r._value = (val + 1) / 2
+            if num == 6:
+                self.hat._value_x = int(val)
+            if num == 7:
+                self.hat._value_y = int(val * -1)
+
+            axis = [
+                self.axis_l,
+                self.axis_l,
+                self.trigger_l,
+                self.axis_r,
+                self.axis_r,
+                self.trigger_r,
+                self.hat,
+                self.hat,
+            ][num]
+
+            self.axis_callback(axis, val)
+
+    def process_events(self, events):
+        for event in events:
+            if not event.is_init:
+                self.process_event(event)
+
+
+def make_events(count):
+    data = b"".join(burst(time_ms, 16000 + time_ms % 2) for time_ms in range(count))
+    # Also exercise the hat reported as buttons
+    data += b"".join(
+        struct.pack(JS_EVENT_FORMAT, count, 1, JS_EVENT_BUTTON, number)
+        for number in range(11, 15)
+    )
+    return [
+        ControllerEvent(
+            time=round(BOOT_TIME + (time_ / 1000), 4),
+            type=type_,
+            number=number,
+            value=value,
+            is_init=False,
+        )
+        for time_, value, type_, number in struct.iter_unpack(JS_EVENT_FORMAT, data)
+    ]
+
+
+def measure(process_events, events):
+    # One batch per burst, as returned by a single read from the device
+    batches = [events[i : i + 7] for i in range(0, len(events), 7)]
+    start = time.perf_counter()
+    for batch in batches:
+        process_events(batch)
+    return len(events) / (time.perf_counter() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    events = make_events(count // 7)
+
+    device = FakeDevice()
+    with device.controller() as controller:
+        controller.axis_l.when_moved = lambda axis: None
+        controller.button_a.when_pressed = lambda button: None
+
+        after = measure(controller.process_events, events)
+    device.close()
+
+    legacy = LegacyController()
+    legacy.axis_l.when_moved = lambda axis: None
+    legacy.button_a.when_pressed = lambda button: None
+    before = measure(legacy.process_events, events)
+
+    print("before: {:10.0f} events/s".format(before))
+    print("after:  {:10.0f} events/s".format(after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Compare one reader thread per controller with a shared Reactor.
+
+Usage: python -m benchmarks.reactor [controllers] [seconds] [bursts per second]
+"""
+
+import resource
+import sys
+import time
+
+from benchmarks.fakedev import FakeDevice, burst
+from xbox360controller import Reactor
+
+
+def run(controllers, seconds, rate, reactor=None):
+    devices = [FakeDevice() for _ in range(controllers)]
+    pads = [
+        device.controller(index, reactor=reactor)
+        for index, device in enumerate(devices)
+    ]
+    received = [0]
+
+    def on_moved(axis):
+        received[0] += 1
+
+    for pad in pads:
+        pad.axis_l.when_moved = on_moved
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = time.process_time()
+    start = time.monotonic()
+    sent = 0
+    while time.monotonic() - start < seconds:
+        data = burst(int((time.monotonic() - start) * 1000), 32767 - sent % 2)
+        for device in devices:
+            device.write(data)
+        sent += 1
+        time.sleep(1 / rate)
+    time.sleep(0.1)
+    cpu = time.process_time() - cpu
+    wakeups = resource.getrusage(resource.RUSAGE_SELF).ru_nvcsw - usage.ru_nvcsw
+
+    for pad, device in zip(pads, devices):
+        pad.close()
+        device.close()
+    return cpu, wakeups, received[0], sent * controllers
+
+
+def main():
+    controllers = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else 250
+
+    print("{} controllers, {} bursts/s for {}s".format(controllers, rate, seconds))
+    results = [("thread per controller", run(controllers, seconds, rate))]
+    with Reactor() as reactor:
+        results.append(("shared reactor", run(controllers, seconds, rate, reactor)))
+
+    for label, (cpu, wakeups, received, sent) in results:
+        print(
+            "{:<22} cpu {:6.3f}s  voluntary context switches {:7}  "
+            "callbacks {} for {} bursts".format(label, cpu, wakeups, received, sent)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Throughput and latency of the event path, without a controller attached.
+
+A generator writes synthetic bursts of joystick events into a pipe standing in
+for the device, each burst ending with a button event whose callback marks the
+burst as handled.
+
+Usage: python -m benchmarks.throughput [bursts] [events per burst]
+"""
+
+import statistics
+import sys
+import threading
+import time
+
+from benchmarks.fakedev import FakeDevice, js_events
+from xbox360controller.linux.joystick import JS_EVENT_AXIS, JS_EVENT_BUTTON
+
+
+def generate_bursts(count, size):
+    """Yield bursts of `size` events: axis changes followed by a button edge."""
+    for i in range(count):
+        value = 20000 + i % 10000
+        axes = [(i, value, JS_EVENT_AXIS, number % 6) for number in range(size - 1)]
+        yield js_events(*axes, (i, (i + 1) % 2, JS_EVENT_BUTTON, 0))
+
+
+class Handled:
+    def __init__(self):
+        # Nothing is kept per burst, so that it doesn't count as allocated
+        self.count = 0
+        self.last = None
+        self._condition = threading.Condition()
+
+    def __call__(self, button):
+        with self._condition:
+            self.last = time.perf_counter()
+            self.count += 1
+            self._condition.notify()
+
+    def wait(self, count, timeout=5):
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.count >= count, timeout):
+                raise RuntimeError("events got lost")
+
+
+class CountingHandled(Handled):
+    def __init__(self):
+        super().__init__()
+        self.blocks = 0
+
+    def __call__(self, button):
+        # Taken before the objects of the batch are freed again
+        self.blocks = sys.getallocatedblocks()
+        super().__call__(button)
+
+
+def attach(controller, handled):
+    controller.button_a.when_pressed = handled
+    controller.button_a.when_released = handled
+    controller.axis_l.when_moved = lambda axis: None
+    controller.axis_r.when_moved = lambda axis: None
+
+
+def throughput(bursts):
+    device = FakeDevice()
+    handled = Handled()
+    with device.controller() as controller:
+        attach(controller, handled)
+        cpu = time.process_time()
+        start = time.perf_counter()
+        for data in bursts:
+            device.write(data)
+        handled.wait(len(bursts))
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+    device.close()
+    return elapsed, cpu
+
+
+def latency(bursts):
+    device = FakeDevice()
+    handled = Handled()
+    latencies = []
+    with device.controller() as controller:
+        attach(controller, handled)
+        for count, data in enumerate(bursts, 1):
+            written = time.perf_counter()
+            device.write(data)
+            handled.wait(count)
+            latencies.append(handled.last - written)
+    device.close()
+    return latencies
+
+
+def allocations(bursts):
+    """Return the number of memory blocks allocated and still in use when the
+    callback of each burst runs, and the number of them not freed again once
+    it was handled. Blocks freed before the callback aren't counted."""
+    device = FakeDevice()
+    handled = CountingHandled()
+    allocated = []
+    kept = []
+    with device.controller() as controller:
+        attach(controller, handled)
+        for count, data in enumerate(bursts, 1):
+            before = sys.getallocatedblocks()
+            device.write(data)
+            handled.wait(count)
+            if count > 1:
+                # The first one creates what is reused afterwards
+                allocated.append(handled.blocks - before)
+                kept.append(sys.getallocatedblocks() - before)
+    device.close()
+    return allocated, kept
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+    bursts = list(generate_bursts(count, size))
+    events = count * size
+
+    elapsed, cpu = throughput(bursts)
+    latencies = latency(bursts[: min(count, 2000)])
+    allocated, kept = allocations(bursts[: min(count, 500)])
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print("{} bursts of {} events".format(count, size))
+    print("throughput:     {:10.0f} events/s".format(events / elapsed))
+    print("cpu time:       {:10.2f} us/event".format(cpu / events * 1e6))
+    print("latency p50:    {:10.1f} us".format(quantiles[49] * 1e6))
+    print("latency p99:    {:10.1f} us".format(quantiles[98] * 1e6))
+    print(
+        "in callback:    {:10.2f} blocks/event".format(
+            statistics.mean(allocated) / size
+        )
+    )
+    print("kept:           {:10.2f} blocks/event".format(statistics.mean(kept) / size))
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,8 @@ setup(
     author_email="mail@linusgroh.de",
     license="MIT",
     url="https://github.com/linusg/xbox360controller",
+    python_requires=">=3.8",
+    extras_require={"analysis": ["numpy"]},
     download_url="https://pypi.org/project/xbox360controller/",
     keywords=[
         "xbox",
@@ -38,10 +40,11 @@ setup(
         "Operating System :: POSIX :: Linux",
         "Programming Language :: Python",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.4",
-        "Programming Language :: Python :: 3.5",
-        "Programming Language :: Python :: 3.6",
-        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
+        "Programming Language :: Python :: 3.12",
         "Programming Language :: Python :: 3 :: Only",
         "Topic :: Games/Entertainment",
         "Topic :: Software Development :: Libraries",
@@ -1,6 +1,72 @@
+import asyncio
+import errno
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
 import unittest
+import warnings
+from unittest import mock
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 import xbox360controller
+from xbox360controller.controller import BOOT_TIME, JS_EVENT_FORMAT, ControllerEvent
+from xbox360controller.evdev import INPUT_EVENT_FORMAT
+from xbox360controller.ff import EffectPool, PatternPlayback, RumblePattern
+from xbox360controller.linux.input import EVIOCRMFF, FF_RUMBLE
+from xbox360controller.output import OutputWriter
+from xbox360controller.record import pack_header, unpack_header
+from xbox360controller.linux.input_event_codes import *
+from xbox360controller.linux.joystick import JS_EVENT_AXIS, JS_EVENT_BUTTON
+
+
+class FakeController(xbox360controller.Xbox360Controller):
+    def __init__(self, *args, **kwargs):
+        pipe_r, self._pipe_w = os.pipe()
+        evdev_r, self._evdev_w = os.pipe()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            super().__init__(
+                *args,
+                device=os.fdopen(pipe_r, "rb", buffering=0),
+                event_device=os.fdopen(evdev_r, "r+b", buffering=0),
+                **kwargs,
+            )
+
+    def write_events(self, *events):
+        os.write(
+            self._pipe_w,
+            b"".join(
+                struct.pack(JS_EVENT_FORMAT, time_, value, type_, number)
+                for time_, value, type_, number in events
+            ),
+        )
+
+    def write_input_events(self, *events):
+        os.write(
+            self._evdev_w,
+            b"".join(
+                struct.pack(INPUT_EVENT_FORMAT, sec, usec, type_, code, value)
+                for sec, usec, type_, code, value in events
+            ),
+        )
+
+    def close(self):
+        super().close()
+        os.close(self._pipe_w)
+        os.close(self._evdev_w)
+
+
+class FakeAsyncController(FakeController, xbox360controller.AsyncXbox360Controller):
+    pass
 
 
 class TestMethods(unittest.TestCase):
@@ -8,5 +74,1115 @@ class TestMethods(unittest.TestCase):
         self.assertEqual(xbox360controller.Xbox360Controller.LED_OFF, 0)
 
 
+class TestEvents(unittest.TestCase):
+    def test_batched_read(self):
+        pressed = threading.Event()
+        with FakeController(event_timeout=0.05) as controller:
+            controller.button_a.when_pressed = lambda button: pressed.set()
+            controller.write_events(
+                (1, 32767, JS_EVENT_AXIS, 0),
+                (1, -32767, JS_EVENT_AXIS, 1),
+                (2, 1, JS_EVENT_BUTTON, 0),
+            )
+            self.assertTrue(pressed.wait(1))
+            self.assertEqual(controller.axis_l.x, 1.0)
+            self.assertEqual(controller.axis_l.y, -1.0)
+            self.assertEqual(controller.read_records, 3)
+            self.assertEqual(controller.records_per_read, 3.0)
+
+    def test_callback_error(self):
+        pressed = threading.Event()
+
+        def fail(button):
+            raise ValueError("callback failed")
+
+        with FakeController(event_timeout=0.05) as controller:
+            controller.button_a.when_pressed = fail
+            controller.button_b.when_pressed = lambda button: pressed.set()
+            with mock.patch("traceback.print_exc") as print_exc:
+                controller.write_events(
+                    (1, 1, JS_EVENT_BUTTON, 0),
+                    (1, 32767, JS_EVENT_AXIS, 0),
+                    (1, 1, JS_EVENT_BUTTON, 1),
+                )
+                self.assertTrue(pressed.wait(1))
+            print_exc.assert_called_once_with()
+            # The rest of the batch was applied and published
+            self.assertEqual(controller.snapshot().axis_l, (1.0, 0.0))
+            self.assertTrue(controller.connected)
+
+    def test_split_record(self):
+        pressed = threading.Event()
+        with FakeController(event_timeout=0.05) as controller:
+            controller.button_b.when_pressed = lambda button: pressed.set()
+            data = struct.pack(JS_EVENT_FORMAT, 1, 32767, JS_EVENT_AXIS, 0)
+            data += struct.pack(JS_EVENT_FORMAT, 2, 1, JS_EVENT_BUTTON, 1)
+            # Like a stream socket returning part of a record
+            os.write(controller._pipe_w, data[:11])
+            time.sleep(0.05)
+            os.write(controller._pipe_w, data[11:])
+            self.assertTrue(pressed.wait(1))
+            self.assertEqual(controller.axis_l.x, 1.0)
+            self.assertEqual(controller.read_records, 2)
+
+    def test_disconnect_and_close(self):
+        errors = []
+        with mock.patch("threading.excepthook", errors.append):
+            for _ in range(50):
+                controller = FakeController(event_timeout=0.05)
+                # Like a HotplugWatcher, not from the thread reading the device
+                controller._disconnected()
+                controller.close()
+        self.assertEqual(errors, [])
+
+    def test_capabilities(self):
+        with FakeController(event_timeout=0.05) as controller:
+            self.assertEqual(controller.capabilities.name, "")
+            self.assertFalse(controller.has_rumble)
+            self.assertFalse(controller.has_led)
+            self.assertEqual(controller.num_axes, 5)
+            self.assertEqual(controller.num_buttons, 11)
+            with self.assertRaises(RuntimeError):
+                controller.set_rumble(1, 1)
+
+            controller.capabilities = controller.capabilities._replace(has_led=True)
+            for status in (-1, 16):
+                with self.assertRaises(ValueError):
+                    controller.set_led(status)
+
+    def test_process_event(self):
+        def event(type_, number, value):
+            return ControllerEvent(
+                time=0, type=type_, number=number, value=value, is_init=False
+            )
+
+        with FakeController(event_timeout=0.05) as controller:
+            controller.process_event(event(JS_EVENT_AXIS, 2, 32767))
+            controller.process_event(event(JS_EVENT_AXIS, 5, -32767))
+            controller.process_event(event(JS_EVENT_AXIS, 7, 32767))
+            controller.process_event(event(JS_EVENT_BUTTON, 11, 1))
+            controller.process_event(event(JS_EVENT_BUTTON, 10, 1))
+            controller.process_event(event(JS_EVENT_AXIS, 8, 1))
+            controller.process_event(event(JS_EVENT_BUTTON, 15, 1))
+            self.assertEqual(controller.trigger_l.value, 1.0)
+            self.assertEqual(controller.trigger_r.value, 0.0)
+            self.assertEqual((controller.hat.x, controller.hat.y), (-1, -1))
+            self.assertTrue(controller.button_thumb_r.is_pressed)
+
+    def test_configure_axis(self):
+        def move(controller, number, value):
+            controller.process_event(
+                ControllerEvent(
+                    time=0,
+                    type=JS_EVENT_AXIS,
+                    number=number,
+                    value=value,
+                    is_init=False,
+                )
+            )
+
+        moved = []
+        with FakeController(event_timeout=0.05) as controller:
+            controller.axis_l.when_moved = lambda axis: moved.append(axis.x)
+            controller.configure_axis("axis_l", deadzone=0.2, outer=0.9)
+            controller.configure_axis(controller.trigger_l, deadzone=0.5, curve=2)
+
+            # Within the radial deadzone, although both components are larger
+            move(controller, 0, 4000)
+            move(controller, 1, 4000)
+            self.assertEqual((controller.axis_l.x, controller.axis_l.y), (0, 0))
+            self.assertEqual(moved, [])
+            move(controller, 1, 0)
+            move(controller, 0, 32767 * 55 // 100)
+            self.assertAlmostEqual(controller.axis_l.x, 0.5, places=3)
+            self.assertEqual(controller.axis_l.y, 0)
+            move(controller, 0, -32767)
+            self.assertAlmostEqual(controller.axis_l.x, -1.0, places=4)
+            self.assertEqual(len(moved), 2)
+
+            move(controller, 2, 0)
+            self.assertAlmostEqual(controller.trigger_l.value, 0.0)
+            move(controller, 2, 16384)
+            self.assertAlmostEqual(controller.trigger_l.value, 0.25, places=3)
+
+            with self.assertRaises(ValueError):
+                controller.configure_axis("hat")
+            with self.assertRaises(ValueError):
+                controller.configure_axis("trigger_r", radial=True)
+
+        with FakeController(event_timeout=0.05, backend="evdev") as controller:
+            controller.configure_axis("axis_r", offset=(0.5, 0))
+            controller.process_events(
+                controller._decode(
+                    struct.pack(INPUT_EVENT_FORMAT, 0, 0, EV_ABS, ABS_RX, 16384)
+                    + struct.pack(INPUT_EVENT_FORMAT, 0, 0, EV_SYN, SYN_REPORT, 0)
+                )
+            )
+            self.assertAlmostEqual(controller.axis_r.x, 0.0, places=3)
+
+    def test_snapshot(self):
+        with FakeController(event_timeout=0.05) as controller:
+            controller.process_events(
+                [
+                    ControllerEvent(
+                        time=5, type=JS_EVENT_AXIS, number=0, value=32767, is_init=False
+                    ),
+                    ControllerEvent(
+                        time=6, type=JS_EVENT_BUTTON, number=1, value=1, is_init=False
+                    ),
+                ]
+            )
+            snapshot = controller.snapshot()
+            controller.process_event(
+                ControllerEvent(
+                    time=7, type=JS_EVENT_BUTTON, number=1, value=0, is_init=False
+                )
+            )
+            self.assertEqual(snapshot.time, 6)
+            self.assertEqual(snapshot.axis_l, (1.0, 0.0))
+            self.assertEqual(snapshot["hat"], (0, 0))
+            self.assertIs(snapshot.button_b, True)
+            self.assertIs(controller.snapshot().button_b, False)
+            self.assertEqual(len(snapshot), 16)
+            with self.assertRaises(AttributeError):
+                snapshot.button_b = False
+            with self.assertRaises(AttributeError):
+                controller.axis_l.foo = 1
+
+    def test_coalesce_axis(self):
+        moved = []
+        done = threading.Event()
+
+        def on_moved(axis):
+            moved.append((axis.x, axis.merged))
+            if len(moved) == 2:
+                done.set()
+
+        with FakeController(event_timeout=1) as controller:
+            controller.axis_l.when_moved = on_moved
+            controller.axis_l.max_rate = 10
+            controller.write_events(
+                *[(1, value, JS_EVENT_AXIS, 0) for value in range(20000, 30000, 1000)]
+            )
+            self.assertTrue(done.wait(1))
+            self.assertEqual(moved, [(20000 / 32767, 0), (29000 / 32767, 8)])
+
+    def test_poll(self):
+        pressed = []
+        threads = threading.active_count()
+        with FakeController(threaded=False) as controller:
+            self.assertEqual(threading.active_count(), threads)
+            controller.button_a.when_pressed = pressed.append
+            self.assertEqual(controller.poll(), 0)
+
+            controller.write_events((1, 1, JS_EVENT_BUTTON, 0))
+            self.assertEqual(controller.poll(callbacks=False), 1)
+            self.assertTrue(controller.button_a.is_pressed)
+            self.assertEqual(pressed, [])
+
+            controller.write_events(
+                *[(2, value, JS_EVENT_AXIS, 0) for value in range(100)],
+                (3, 0, JS_EVENT_BUTTON, 0),
+                (4, 1, JS_EVENT_BUTTON, 0),
+            )
+            self.assertEqual(controller.poll(), 102)
+            self.assertEqual(controller.axis_l.x, 99 / 32767)
+            self.assertEqual(pressed, [controller.button_a])
+
+    def test_poll_callback_error(self):
+        def fail(button):
+            raise ValueError("callback failed")
+
+        with FakeController(threaded=False) as controller:
+            controller.button_a.when_pressed = fail
+            controller.write_events(
+                (1, 1, JS_EVENT_BUTTON, 0),
+                (2, 1, JS_EVENT_BUTTON, 1),
+                (3, 32767, JS_EVENT_AXIS, 0),
+            )
+            with self.assertRaises(ValueError):
+                controller.poll()
+            # The rest of the batch was applied and published
+            self.assertTrue(controller.button_b.is_pressed)
+            self.assertEqual(controller.axis_l.x, 1.0)
+            self.assertEqual(controller.snapshot().axis_l, (1.0, 0))
+            self.assertEqual(controller.poll(), 0)
+
+    def test_allocations(self):
+        blocks = []
+
+        def count(controller, events):
+            # Blocks allocated by a batch and still in use at its callback,
+            # after a warm up
+            for _ in range(5):
+                controller.write_events(*events)
+                before = sys.getallocatedblocks()
+                controller.poll()
+            return blocks[-1] - before
+
+        with FakeController(threaded=False) as controller:
+            controller.button_b.when_pressed = lambda button: blocks.append(
+                sys.getallocatedblocks()
+            )
+            axes = [(1, value, JS_EVENT_AXIS, value % 6) for value in range(63)]
+            # Released first, so that each batch ends with a press
+            release, press = (1, 0, JS_EVENT_BUTTON, 1), (1, 1, JS_EVENT_BUTTON, 1)
+            single = count(controller, [release] + axes[:1] + [press])
+            batch = count(controller, [release] + axes + [press])
+            self.assertEqual(controller.axis_r.x, 57 / 32767)
+        # Only the batch allocates, not its events without callbacks
+        self.assertLess(batch - single, 8)
+
+    def test_combos(self):
+        def edges(controller, time_, *edges):
+            for number, value in edges:
+                controller.process_event(
+                    ControllerEvent(
+                        time=time_,
+                        type=JS_EVENT_BUTTON,
+                        number=number,
+                        value=value,
+                        is_init=False,
+                    )
+                )
+
+        matched = []
+        with FakeController(event_timeout=0.05) as controller:
+            combos = xbox360controller.ComboMatcher(controller)
+            combos.add_chord(["button_mode", "button_a"], matched.append, within=0.3)
+            combos.add_sequence(
+                [controller.button_x, controller.button_x, controller.button_b],
+                matched.append,
+                within=1,
+                name="xxb",
+            )
+            combos.add_sequence(["button_x", "button_b"], matched.append)
+
+            # Mode held, A pressed too late, then in time
+            edges(controller, 10.0, (8, 1))
+            edges(controller, 10.5, (0, 1), (0, 0))
+            edges(controller, 11.0, (8, 0), (8, 1))
+            edges(controller, 11.2, (0, 1), (0, 0), (8, 0))
+            self.assertEqual([combo.kind for combo in matched], ["chord"])
+
+            # Overlapping sequences, the longer one too slow the second time
+            del matched[:]
+            for time_, number in [(20, 2), (20.1, 2), (20.2, 1), (21, 2), (21.2, 2)]:
+                edges(controller, time_, (number, 1), (number, 0))
+            edges(controller, 22.5, (1, 1), (1, 0))
+            self.assertEqual(
+                [repr(combo) for combo in matched],
+                ["<Combo xxb>"] + ["<Combo button_x+button_b>"] * 2,
+            )
+            self.assertEqual(combos.matches, 4)
+
+    def test_stats(self):
+        traced = []
+        done = threading.Event()
+
+        def trace(record):
+            traced.append(record)
+            done.set()
+
+        with FakeController(event_timeout=0.05) as controller:
+            controller.button_a.when_pressed = lambda button: time.sleep(0.01)
+            controller.trace = trace
+            controller.write_events(
+                (1, 32767, JS_EVENT_AXIS, 0), (2, 1, JS_EVENT_BUTTON, 0)
+            )
+            self.assertTrue(done.wait(1))
+            stats = controller.stats(reset=True)
+            self.assertEqual(controller.stats()["events"], 0)
+
+        self.assertEqual(
+            (stats["events"], stats["batches"], stats["callbacks"]), (2, 1, 1)
+        )
+        self.assertGreaterEqual(stats["syscalls"], 2)
+        self.assertEqual(
+            stats["slow_calls"], {"TestEvents.test_stats.<locals>.<lambda>": 1}
+        )
+        # joydev timestamps are too coarse, latencies are from the read
+        self.assertEqual(stats["event_age"]["count"], 0)
+        self.assertEqual(stats["callback_latency"]["count"], 1)
+        record = traced[0]
+        self.assertIs(record.target, controller.button_a)
+        self.assertLessEqual(record.read_time, record.start)
+        self.assertGreaterEqual(record.end - record.start, 0.01)
+
+    def test_shared_state(self):
+        with FakeController(event_timeout=0.05) as controller:
+            publisher = xbox360controller.StatePublisher(controller)
+            controller.process_event(
+                ControllerEvent(
+                    time=5.0, type=JS_EVENT_BUTTON, number=0, value=1, is_init=False
+                )
+            )
+            script = (
+                "import xbox360controller\n"
+                "with xbox360controller.StateReader({!r}) as reader:\n"
+                "    snapshot = reader.snapshot()\n"
+                "    print(reader.sequence, snapshot.time, snapshot.button_a,"
+                " snapshot.axis_l)"
+            ).format(publisher.name)
+            output = subprocess.run(
+                [sys.executable, "-c", script],
+                capture_output=True,
+                check=True,
+                text=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+            publisher.close()
+        self.assertEqual(
+            output.stdout.split(" ", 3), ["2", "5.0", "True", "(0.0, 0.0)\n"]
+        )
+        self.assertEqual(output.stderr, "")
+
+    def test_evdev(self):
+        moved = []
+        pressed = threading.Event()
+        with FakeController(event_timeout=0.05, backend="evdev") as controller:
+            controller.axis_l.when_moved = lambda axis: moved.append((axis.x, axis.y))
+            controller.button_y.when_pressed = lambda button: pressed.set()
+            controller.write_input_events(
+                (10, 1, EV_ABS, ABS_X, 32767),
+                (10, 1, EV_ABS, ABS_Y, -32768),
+                (10, 1, EV_ABS, ABS_Z, 255),
+                (10, 1, EV_SYN, SYN_REPORT, 0),
+                (10, 2, EV_KEY, BTN_TRIGGER_HAPPY3, 1),
+                (10, 2, EV_KEY, BTN_Y, 1),
+                (10, 2, EV_SYN, SYN_REPORT, 0),
+            )
+            self.assertTrue(pressed.wait(1))
+            self.assertEqual(moved, [(1.0, -1.0)])
+            self.assertEqual(controller.trigger_l.value, 1.0)
+            self.assertEqual(controller.hat.y, 1)
+            self.assertEqual(controller.snapshot().time, 10.000002)
+            self.assertGreaterEqual(controller.stats()["event_age"]["count"], 1)
+
+    def test_record_replay(self):
+        pressed = threading.Event()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "session.rec")
+            with FakeController(event_timeout=0.05) as controller:
+                controller.button_a.when_pressed = lambda button: pressed.set()
+                with xbox360controller.Recorder(controller, path) as recorder:
+                    controller.write_events(
+                        (1, 32767, JS_EVENT_AXIS, 4),
+                        (1, 32767, JS_EVENT_AXIS, 5),
+                        (30, 1, JS_EVENT_BUTTON, 0),
+                    )
+                    self.assertTrue(pressed.wait(1))
+                self.assertEqual(recorder.records, 3)
+
+            moved = []
+            with FakeController(event_timeout=0.05) as controller:
+                controller.axis_r.when_moved = moved.append
+                with xbox360controller.Replayer(path) as replayer:
+                    self.assertEqual(len(replayer), 3)
+                    start = time.monotonic()
+                    replayer.replay(controller)
+                    self.assertGreaterEqual(time.monotonic() - start, 0.029)
+                self.assertEqual(moved, [controller.axis_r])
+                self.assertEqual(controller.trigger_r.value, 1.0)
+                self.assertTrue(controller.button_a.is_pressed)
+
+    def test_replay_abs_ranges(self):
+        class SmallRangeController(FakeController):
+            _abs_ranges = {ABS_X: (-512, 511)}
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "session.rec")
+            with FakeController(event_timeout=0.05, backend="evdev") as controller:
+                xbox360controller.Recorder(controller, path).close()
+            with SmallRangeController(
+                event_timeout=0.05, backend="evdev"
+            ) as controller:
+                with xbox360controller.Replayer(path) as replayer:
+                    with self.assertRaises(ValueError):
+                        replayer.replay(controller)
+
+    def test_history(self):
+        pressed = threading.Event()
+        with FakeController(event_timeout=0.05) as controller:
+            controller.button_b.when_pressed = lambda button: pressed.set()
+            history = xbox360controller.EventHistory(controller, capacity=4)
+            controller.write_events(
+                (1000, 1, JS_EVENT_BUTTON, 0),
+                (2000, 0, JS_EVENT_BUTTON, 0),
+                (3000, 32767, JS_EVENT_AXIS, 5),
+                (4000, 1, JS_EVENT_BUTTON, 0),
+                (5000, -32767, JS_EVENT_AXIS, 5),
+                (6000, 1, JS_EVENT_BUTTON, 1),
+            )
+            self.assertTrue(pressed.wait(1))
+            history.close()
+
+            self.assertEqual(len(history), 4)
+            first = history.events()[0].time
+            self.assertEqual(round(first - BOOT_TIME, 4), 3.0)
+            self.assertEqual(
+                [e.value for e in history.events(first + 0.5, first + 2.5)],
+                [1, -32767],
+            )
+            self.assertEqual(history.count(first, controls=["button_a"]), 1)
+            self.assertEqual(
+                list(history.slice(controls=[controller.trigger_r]).values),
+                [32767, -32767],
+            )
+            self.assertEqual(history.count(end=first), 0)
+            self.assertEqual(history.count(first + 0.5, first + 2.5), 2)
+            self.assertEqual(history.count(), 4)
+
+            data = history.to_bytes()
+            self.assertEqual(len(data), 4 * struct.calcsize(JS_EVENT_FORMAT))
+            self.assertEqual(
+                struct.unpack_from(JS_EVENT_FORMAT, data)[:3],
+                (3000, 32767, JS_EVENT_AXIS),
+            )
+
+    def test_event_server(self):
+        pressed = threading.Barrier(3, timeout=1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "controller.sock")
+            with FakeController(event_timeout=0.05) as controller:
+                server = xbox360controller.EventServer(controller, path)
+                remote = xbox360controller.RemoteController(path, event_timeout=0.05)
+                filtered = xbox360controller.RemoteController(
+                    path, buttons=["button_a"], event_timeout=0.05
+                )
+                for client in (remote, filtered):
+                    client.button_a.when_pressed = lambda button: pressed.wait()
+                self.assertEqual(server.clients, 2)
+                self.assertEqual(remote.name, controller.name)
+
+                controller.write_events(
+                    (1, 32767, JS_EVENT_AXIS, 5),
+                    (2, 1, JS_EVENT_BUTTON, 0),
+                )
+                pressed.wait()
+                self.assertEqual(remote.trigger_r.value, 1.0)
+                self.assertEqual(filtered.trigger_r.value, 0.0)
+                self.assertTrue(filtered.button_a.is_pressed)
+
+                # Clients connecting later get the current state
+                with xbox360controller.RemoteController(
+                    path, event_timeout=0.05
+                ) as late:
+                    self.assertEqual(late.trigger_r.value, 1.0)
+                    self.assertTrue(late.button_a.is_pressed)
+                    self.assertFalse(late.button_b.is_pressed)
+
+                filtered.close()
+                remote.close()
+                server.close()
+                self.assertFalse(os.path.exists(path))
+                self.assertEqual(server.dropped, 0)
+
+    def test_event_server_evdev(self):
+        # Ranges other than the defaults, which the client can't ask for
+        class SmallRangeController(FakeController):
+            _abs_ranges = {ABS_X: (-512, 511)}
+
+        pressed = threading.Event()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "controller.sock")
+            with SmallRangeController(
+                event_timeout=0.05, backend="evdev"
+            ) as controller:
+                with xbox360controller.EventServer(controller, path):
+                    controller.button_b.when_pressed = lambda button: pressed.set()
+                    controller.write_input_events(
+                        (1, 0, EV_ABS, ABS_X, 511),
+                        (1, 0, EV_KEY, BTN_B, 1),
+                        (1, 0, EV_SYN, SYN_REPORT, 0),
+                    )
+                    self.assertTrue(pressed.wait(1))
+                    with xbox360controller.RemoteController(
+                        path, axes=["axis_l"], event_timeout=0.05
+                    ) as remote:
+                        self.assertEqual(remote._evdev._abs[ABS_X][5:7], (-512, 511))
+                        self.assertEqual(remote.axis_l.x, 1.0)
+                        self.assertFalse(remote.button_b.is_pressed)
+
+    def test_event_server_drop_oldest(self):
+        from xbox360controller.server import _Client
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "controller.sock")
+            with FakeController(event_timeout=0.05, backend="evdev") as controller:
+                with xbox360controller.EventServer(controller, path) as server:
+                    size = controller._record_size
+                    records = [
+                        struct.pack(INPUT_EVENT_FORMAT, 1, 0, EV_KEY, BTN_A, 1),
+                        struct.pack(INPUT_EVENT_FORMAT, 1, 0, EV_SYN, SYN_REPORT, 0),
+                        struct.pack(INPUT_EVENT_FORMAT, 2, 0, EV_KEY, BTN_B, 1),
+                        struct.pack(INPUT_EVENT_FORMAT, 2, 0, EV_SYN, SYN_REPORT, 0),
+                    ]
+                    client = _Client(None)
+                    client.buffer += b"".join(records)
+                    # The marker replaces the oldest events, not appended
+                    server._drop_oldest(client, 2 * size)
+                    self.assertEqual(client.buffer, server._marker + records[3])
+                    server._drop_oldest(client, size)
+                    self.assertEqual(client.buffer, server._marker)
+                    self.assertEqual(server.dropped, 4)
+
+    def test_reactor(self):
+        pressed = []
+        done = threading.Event()
+
+        def on_pressed(button):
+            pressed.append(button)
+            if len(pressed) == 2:
+                done.set()
+
+        with xbox360controller.Reactor(timeout=0.05) as reactor:
+            first = FakeController(event_timeout=0.05, reactor=reactor)
+            second = FakeController(event_timeout=0.05)
+            reactor.add(second)
+            self.assertIsNone(second._event_thread)
+            self.assertEqual(len(reactor), 2)
+
+            first.button_a.when_pressed = on_pressed
+            second.button_b.when_pressed = on_pressed
+            first.write_events((1, 1, JS_EVENT_BUTTON, 0))
+            second.write_events((1, 1, JS_EVENT_BUTTON, 1))
+            self.assertTrue(done.wait(1))
+            self.assertCountEqual(pressed, [first.button_a, second.button_b])
+
+            reactor.remove(second)
+            self.assertEqual(len(reactor), 1)
+            self.assertIsNotNone(second._event_thread)
+
+            first.close()
+            second.close()
+            self.assertEqual(len(reactor), 0)
+
+    def test_reactor_callback_error(self):
+        pressed = threading.Event()
+
+        def fail(button):
+            raise ConnectionRefusedError()
+
+        with xbox360controller.Reactor() as reactor:
+            with FakeController(reactor=reactor) as controller:
+                controller.button_a.when_pressed = fail
+                controller.button_b.when_pressed = lambda button: pressed.set()
+                with mock.patch("traceback.print_exc") as print_exc:
+                    controller.write_events(
+                        (1, 1, JS_EVENT_BUTTON, 0), (1, 1, JS_EVENT_BUTTON, 1)
+                    )
+                    self.assertTrue(pressed.wait(1))
+                print_exc.assert_called_once_with()
+                self.assertTrue(controller.connected)
+                self.assertEqual(reactor.controllers, [controller])
+
+    def test_idle_and_close(self):
+        controllers = [FakeController(event_timeout=10) for _ in range(16)]
+        reactor = xbox360controller.Reactor()
+        reactor.add(controllers[0])
+        time.sleep(0.05)
+        syscalls = [controller.stats()["syscalls"] for controller in controllers]
+        wakeups = reactor.wakeups
+        time.sleep(0.2)
+        # Nothing wakes up without input
+        self.assertEqual(
+            [controller.stats()["syscalls"] for controller in controllers], syscalls
+        )
+        self.assertEqual(reactor.wakeups, wakeups)
+
+        start = time.monotonic()
+        for controller in controllers:
+            controller.close()
+        reactor.close()
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_asyncio(self):
+        async def main():
+            moved = []
+            async with FakeAsyncController() as controller:
+                controller.axis_r.when_moved = moved.append
+                controller.write_events(
+                    (1, 32767, JS_EVENT_AXIS, 3), (2, 1, JS_EVENT_BUTTON, 2)
+                )
+                events = []
+                async for event in controller.events():
+                    events.append(event)
+                    if len(events) == 2:
+                        break
+                self.assertIsNone(controller._event_thread)
+                self.assertEqual([event.number for event in events], [3, 2])
+                self.assertEqual(moved, [controller.axis_r])
+                self.assertTrue(controller.button_x.is_pressed)
+
+        asyncio.run(main())
+
+    def test_asyncio_loop(self):
+        with self.assertRaises(RuntimeError):
+            # Without a running loop to default to
+            xbox360controller.AsyncXbox360Controller(device=os.devnull)
+        loop = asyncio.new_event_loop()
+        try:
+            with FakeAsyncController(loop=loop) as controller:
+                self.assertIs(controller._loop, loop)
+                self.assertIsNotNone(controller._reader_fd)
+        finally:
+            loop.close()
+
+    def test_asyncio_callback_error(self):
+        def fail(button):
+            raise ConnectionRefusedError("callback failed")
+
+        async def main():
+            async with FakeAsyncController() as controller:
+                controller.button_a.when_pressed = fail
+                with mock.patch("traceback.print_exc") as print_exc:
+                    controller.write_events(
+                        (1, 1, JS_EVENT_BUTTON, 0), (1, 1, JS_EVENT_BUTTON, 1)
+                    )
+                    async for event in controller.events():
+                        if event.number == 1:
+                            break
+                print_exc.assert_called_once_with()
+                self.assertTrue(controller.button_b.is_pressed)
+                self.assertTrue(controller.connected)
+                self.assertIsNotNone(controller._reader_fd)
+
+        asyncio.run(main())
+
+
+@unittest.skipIf(numpy is None, "needs numpy")
+class TestAnalysis(unittest.TestCase):
+    def header(self, **kwargs):
+        with FakeController(event_timeout=0.05, **kwargs) as controller:
+            header, _ = unpack_header(pack_header(controller))
+        return header
+
+    def test_resample(self):
+        from xbox360controller import analysis
+
+        data = b"".join(
+            struct.pack(JS_EVENT_FORMAT, time_, value, type_, number)
+            for time_, value, type_, number in (
+                (0, 0, JS_EVENT_AXIS | 0x80, 2),
+                (1000, -32767, JS_EVENT_AXIS, 2),
+                (1220, 32767, JS_EVENT_AXIS, 7),
+                (1220, 1, JS_EVENT_BUTTON, 0),
+                (1470, 32767, JS_EVENT_AXIS, 2),
+                (1630, 0, JS_EVENT_BUTTON, 0),
+            )
+        )
+        events = analysis.decode(data)
+        self.assertEqual(len(events), 6)
+        # Samples between the millisecond timestamps of joydev
+        start = events["time"][1] - 0.05
+        samples = analysis.resample(
+            events, self.header(), rate=10, start=start, end=start + 0.6
+        )
+        self.assertEqual(len(samples), 7)
+        self.assertEqual(list(samples["trigger_l"]), [0, 0, 0, 0, 0, 0, 1])
+        self.assertEqual(list(samples["hat_y"]), [0, 0, 0, -1, -1, -1, -1])
+        self.assertEqual(list(samples["button_a"]), [0, 0, 0, 1, 1, 1, 1])
+        self.assertEqual(list(samples["axis_r_x"]), [0] * 7)
+
+    def test_resample_on_grid(self):
+        from xbox360controller import analysis
+
+        data = b"".join(
+            struct.pack(JS_EVENT_FORMAT, time_, value, type_, number)
+            for time_, value, type_, number in (
+                (1000, 1, JS_EVENT_BUTTON, 0),
+                (1200, 0, JS_EVENT_BUTTON, 0),
+                (1300, 32767, JS_EVENT_AXIS, 7),
+            )
+        )
+        events = analysis.decode(data)
+        # Events right at the samples, the first one at start
+        start = events["time"][0]
+        samples = analysis.resample(
+            events, self.header(), rate=10, start=start, end=start + 0.4
+        )
+        self.assertEqual(len(samples), 5)
+        self.assertEqual(list(samples["button_a"]), [1, 1, 0, 0, 0])
+        self.assertEqual(list(samples["hat_y"]), [0, 0, 0, -1, -1])
+
+    def test_resample_evdev(self):
+        from xbox360controller import analysis
+
+        data = b"".join(
+            struct.pack(INPUT_EVENT_FORMAT, sec, usec, type_, code, value)
+            for sec, usec, type_, code, value in (
+                (10, 0, EV_ABS, ABS_X, 32767),
+                (10, 0, EV_SYN, SYN_REPORT, 0),
+                (10, 500000, EV_ABS, ABS_X, -32768),
+                (10, 500000, EV_SYN, SYN_DROPPED, 0),
+                (10, 600000, EV_KEY, BTN_B, 1),
+                (10, 600000, EV_SYN, SYN_REPORT, 0),
+                (11, 0, EV_KEY, BTN_B, 1),
+                (11, 0, EV_SYN, SYN_REPORT, 0),
+                (11, 0, EV_ABS, ABS_X, 0),
+            )
+        )
+        with FakeController(event_timeout=0.05, backend="evdev") as controller:
+            controller.configure_axis("axis_l", deadzone=0.5, radial=True)
+            samples = analysis.resample(
+                analysis.decode(data, "evdev"),
+                self.header(backend="evdev"),
+                rate=2,
+                controller=controller,
+            )
+            # The frame after SYN_DROPPED and the incomplete one are skipped
+            controller.process_events(controller._decode(data))
+            self.assertTrue((samples["axis_l_x"] == controller.axis_l.x).all())
+        self.assertEqual(list(samples["time"]), [10.0, 10.5, 11.0])
+        self.assertEqual(list(samples["button_b"]), [0, 0, 1])
+
+    def test_resample_abs_ranges(self):
+        from xbox360controller import analysis
+
+        data = b"".join(
+            struct.pack(INPUT_EVENT_FORMAT, sec, usec, type_, code, value)
+            for sec, usec, type_, code, value in (
+                (10, 0, EV_ABS, ABS_X, 511),
+                (10, 0, EV_SYN, SYN_REPORT, 0),
+            )
+        )
+        header = self.header(backend="evdev")
+        # The recorded ranges, not the ones of a device
+        header.abs_ranges[ABS_X] = (-512, 511)
+        samples = analysis.resample(analysis.decode(data, "evdev"), header)
+        self.assertEqual(list(samples["axis_l_x"]), [1.0])
+
+        with FakeController(event_timeout=0.05) as controller:
+            with self.assertRaises(ValueError):
+                analysis.resample(
+                    analysis.decode(data, "evdev"), header, controller=controller
+                )
+
+
+class TestHotplug(unittest.TestCase):
+    def test_enumerate(self):
+        with tempfile.TemporaryDirectory() as sysfs:
+            for index in (0, 2):
+                base = os.path.join(sysfs, "js{}".format(index), "device")
+                os.makedirs(os.path.join(base, "id"))
+                os.makedirs(os.path.join(base, "event1{}".format(index)))
+                with open(os.path.join(base, "name"), "w") as f:
+                    f.write("Microsoft X-Box 360 pad {}\n".format(index))
+                with open(os.path.join(base, "id", "vendor"), "w") as f:
+                    f.write("045e\n")
+
+            infos = xbox360controller.enumerate_controllers(sysfs=sysfs)
+            self.assertEqual([info.index for info in infos], [0, 2])
+            self.assertEqual(infos[1].name, "Microsoft X-Box 360 pad 2")
+            self.assertEqual(infos[1].vendor, 0x045E)
+            self.assertIsNone(infos[1].product)
+            self.assertEqual(infos[1].device, "/dev/input/js2")
+            self.assertEqual(infos[1].event_device, "/dev/input/event12")
+
+    def test_reconnect(self):
+        connected = threading.Event()
+        disconnected = threading.Event()
+        pressed = threading.Event()
+
+        with tempfile.TemporaryDirectory() as dev:
+            path = os.path.join(dev, "js0")
+
+            def plug():
+                fifo = os.path.join(dev, "fifo")
+                os.mkfifo(fifo)
+                # Keep a writer around so opening the fifo doesn't block
+                fd = os.open(fifo, os.O_RDWR)
+                os.rename(fifo, path)
+                return fd
+
+            fd = plug()
+            watcher = xbox360controller.HotplugWatcher(
+                on_connect=lambda index: connected.set(),
+                on_disconnect=lambda index: disconnected.set(),
+                dev=dev,
+                timeout=0.05,
+            )
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                controller = xbox360controller.Xbox360Controller(
+                    event_timeout=0.05, device=path, event_device=os.devnull
+                )
+            controller.button_a.when_pressed = lambda button: pressed.set()
+            watcher.attach(controller)
+            self.assertEqual(watcher.connected, [0])
+
+            os.unlink(path)
+            os.close(fd)
+            self.assertTrue(disconnected.wait(1))
+            self.assertFalse(controller.connected)
+
+            failed = threading.Event()
+            with mock.patch.object(
+                controller, "reconnect", side_effect=PermissionError()
+            ), mock.patch("traceback.print_exc", side_effect=failed.set):
+                fd = plug()
+                self.assertTrue(failed.wait(1))
+            self.assertEqual(watcher.connected, [])
+            self.assertFalse(connected.is_set())
+
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                # Tried again when udev updates the permissions
+                os.chmod(path, 0o600)
+                self.assertTrue(connected.wait(1))
+            self.assertTrue(controller.connected)
+            os.write(fd, struct.pack(JS_EVENT_FORMAT, 1, 1, JS_EVENT_BUTTON, 0))
+            self.assertTrue(pressed.wait(1))
+
+            os.unlink(path)
+            os.close(fd)
+            disconnected.clear()
+            connected.clear()
+            self.assertTrue(disconnected.wait(1))
+            failed.clear()
+            with mock.patch.object(
+                controller, "reconnect", side_effect=FileNotFoundError()
+            ), mock.patch("traceback.print_exc", side_effect=failed.set):
+                fd = plug()
+                self.assertTrue(failed.wait(1))
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                # Tried again when its event device shows up
+                open(os.path.join(dev, "event3"), "w").close()
+                self.assertTrue(connected.wait(1))
+            self.assertTrue(controller.connected)
+
+            controller.close()
+            watcher.close()
+            os.close(fd)
+
+    def test_asyncio(self):
+        async def main():
+            with tempfile.TemporaryDirectory() as dev:
+                with xbox360controller.HotplugWatcher(dev=dev) as watcher:
+                    async with FakeAsyncController() as controller:
+                        watcher.attach(controller)
+                        watcher._connected.add(0)
+                        thread = threading.Thread(
+                            target=watcher._handle_disconnect, args=(0,)
+                        )
+                        thread.start()
+                        thread.join()
+                        # Left to the loop, which owns the reader
+                        self.assertTrue(controller.connected)
+                        await asyncio.sleep(0)
+                        self.assertFalse(controller.connected)
+                        self.assertIsNone(controller._reader_fd)
+
+                        open(os.path.join(dev, "js0"), "w").close()
+                        # The error ends up in the loop's exception handler
+                        loop = asyncio.get_running_loop()
+                        loop.set_exception_handler(lambda loop, context: None)
+                        with mock.patch.object(
+                            controller, "reconnect", side_effect=PermissionError()
+                        ):
+                            thread = threading.Thread(
+                                target=watcher._handle_connect, args=(0,)
+                            )
+                            thread.start()
+                            thread.join()
+                            await asyncio.sleep(0)
+                        # Failed on the loop, so tried again later
+                        self.assertEqual(watcher.connected, [])
+                        self.assertEqual(watcher._pending, {0})
+
+        asyncio.run(main())
+
+
+class TestDispatcher(unittest.TestCase):
+    def run_blocked(self, policy, targets):
+        release = threading.Event()
+        ran = []
+
+        def callback(target):
+            release.wait(1)
+            ran.append(target)
+
+        dispatcher = xbox360controller.Dispatcher(maxsize=2, policy=policy)
+        dispatcher.submit(callback, "busy")
+        while dispatcher.queue_depth:
+            time.sleep(0.001)
+        for target in targets:
+            dispatcher.submit(callback, target)
+        depth = dispatcher.queue_depth
+        release.set()
+        dispatcher.close()
+        return dispatcher, depth, ran
+
+    def test_drop_oldest(self):
+        dispatcher, depth, ran = self.run_blocked("drop_oldest", "abc")
+        self.assertEqual(depth, 2)
+        self.assertEqual(dispatcher.dropped, 1)
+        self.assertEqual(ran, ["busy", "b", "c"])
+
+    def test_coalesce(self):
+        dispatcher, depth, ran = self.run_blocked("coalesce", "aab")
+        self.assertEqual(depth, 2)
+        self.assertEqual(dispatcher.coalesced, 1)
+        self.assertEqual(dispatcher.dropped, 0)
+        self.assertEqual(ran, ["busy", "a", "b"])
+
+    def test_coalesce_controller(self):
+        release = threading.Event()
+        ran = []
+
+        def moved(axis):
+            release.wait(1)
+            ran.append(axis.x)
+
+        with xbox360controller.Dispatcher(policy="coalesce") as dispatcher:
+            with FakeController(threaded=False, dispatcher=dispatcher) as controller:
+                controller.axis_l.when_moved = moved
+                controller.button_a.when_pressed = ran.append
+                controller.button_a.when_released = ran.append
+                controller.write_events((1, 10000, JS_EVENT_AXIS, 0))
+                controller.poll()
+                # Blocking the worker
+                while dispatcher.queue_depth:
+                    time.sleep(0.001)
+                for value in (20000, 32767):
+                    controller.write_events((1, value, JS_EVENT_AXIS, 0))
+                    controller.poll()
+                controller.write_events(
+                    *[(2, value, JS_EVENT_BUTTON, 0) for value in (1, 0, 1)]
+                )
+                controller.poll()
+                release.set()
+        self.assertEqual(dispatcher.coalesced, 1)
+        # Each edge of the button is delivered, the last one matching its state
+        self.assertEqual(ran, [1.0, 1.0] + [controller.button_a] * 3)
+
+    def test_controller(self):
+        pressed = threading.Event()
+        with xbox360controller.Dispatcher(workers=2) as dispatcher:
+            controller = FakeController(event_timeout=0.05, dispatcher=dispatcher)
+            with controller:
+                controller.button_a.when_pressed = lambda button: pressed.set()
+                controller.write_events((1, 1, JS_EVENT_BUTTON, 0))
+                self.assertTrue(pressed.wait(1))
+        self.assertEqual(dispatcher.submitted, 1)
+        # Timed like the callbacks run by the controller's own thread
+        self.assertEqual(controller.stats()["callbacks"], 1)
+
+
+class TestEffects(unittest.TestCase):
+    def test_effect_pool(self):
+        # A device with room for a single effect
+        uploaded = {}
+
+        def fake_ioctl(file, request, arg):
+            if request == EVIOCRMFF:
+                del uploaded[arg]
+                return 0
+            effect_id = struct.unpack_from("h", arg, 2)[0]
+            if effect_id == -1:
+                if uploaded:
+                    raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+                effect_id = 7
+            uploaded[effect_id] = arg
+            return arg[:2] + struct.pack("h", effect_id) + arg[4:]
+
+        pipe_r, pipe_w = os.pipe()
+        file = os.fdopen(pipe_w, "wb", buffering=0)
+        with file, os.fdopen(pipe_r, "rb") as r:
+            with mock.patch("xbox360controller.ff.ioctl", fake_ioctl):
+                effects = EffectPool(file, size=2)
+                for strong in (100, 200, 200):
+                    effect_id = effects.upload(0, FF_RUMBLE, 1000, 0, strong, 0)
+                    effects.play(effect_id)
+                self.assertEqual(effect_id, 7)
+                self.assertEqual(
+                    (effects.uploads, effects.updates, effects.reuses), (1, 1, 1)
+                )
+                self.assertEqual(len(r.read(3 * struct.calcsize("2l2hi"))), 72)
+
+                # Running out of space starts over with an empty pool
+                self.assertEqual(effects.upload(1, FF_RUMBLE, 500, 0, 0, 1), 7)
+                self.assertEqual(effects.ids, (-1, 7))
+                effects.free()
+                self.assertEqual(effects.ids, (-1, -1))
+                self.assertEqual(uploaded, {})
+
+                # A pattern playing effects that are freed is stopped first
+                effect_id = effects.upload(1, FF_RUMBLE, 500, 0, 0, 1)
+                playback = PatternPlayback(effects, [effect_id], 50, loop=True)
+                self.assertEqual(effects.upload(0, FF_RUMBLE, 500, 0, 1, 0), 7)
+                self.assertFalse(playback.playing)
+                self.assertIsNone(effects.playback)
+                self.assertEqual(effects.ids, (7, -1))
+
+    def test_rumble_pattern(self):
+        pattern = RumblePattern.pulse(0.5, on=20, off=10, count=2)
+        self.assertEqual(pattern.duration, 60)
+        self.assertEqual(
+            pattern.effects(), [(0, 20, 32767, 32767), (30, 20, 32767, 32767)]
+        )
+        ramp = RumblePattern.ramp(0, 1, 100, steps=3)
+        self.assertEqual([step[2] for step in ramp.steps], [33, 34, 33])
+        self.assertEqual(ramp.effects()[-1], (67, 33, 65535, 65535))
+
+        played = []
+        pool = types.SimpleNamespace(
+            play=lambda *ids, count=1: played.append((ids, count)),
+            stop=lambda *ids: played.append((ids, 0)),
+        )
+        playback = PatternPlayback(pool, [3, 4], 20, loop=True)
+        time.sleep(0.05)
+        playback.cancel()
+        self.assertFalse(playback.playing)
+        self.assertGreaterEqual(played.count(((3, 4), 1)), 2)
+        self.assertEqual(played[-1], ((3, 4), 0))
+
+    def test_pattern_stopped_on_disconnect(self):
+        played = []
+        pool = types.SimpleNamespace(
+            play=lambda *ids, count=1: played.append((ids, count)),
+            stop=lambda *ids: played.append((ids, 0)),
+        )
+        with FakeController(event_timeout=0.05) as controller:
+            playback = PatternPlayback(pool, [1], 10, loop=True)
+            controller._pattern = playback
+            controller._disconnected()
+            self.assertFalse(playback.playing)
+            self.assertFalse(playback._thread.is_alive())
+            self.assertIsNone(controller._pattern)
+            self.assertEqual(played[-1], ((1,), 0))
+
+    def test_output_writer(self):
+        written = []
+        controller = types.SimpleNamespace(
+            _write_rumble=lambda *args: written.append(("rumble",) + args),
+            _write_led=lambda status: written.append(("led", status)),
+        )
+        output = OutputWriter(controller, rate=10)
+        output.submit("led", 1)
+        # Within the first interval, only the latest state of each output
+        # is sent
+        time.sleep(0.02)
+        for strong in range(5):
+            output.submit("rumble", strong, 0, 100)
+        output.submit("led", 2)
+        output.submit("led", 1)
+        output.close()
+        # Blinking again starts over
+        self.assertEqual(written, [("led", 1), ("rumble", 4, 0, 100), ("led", 1)])
+        self.assertEqual((output.merged, output.skipped, output.written), (5, 0, 3))
+
+        written.clear()
+        output = OutputWriter(controller, rate=10)
+        output.submit("led", 6)
+        time.sleep(0.02)
+        output.submit("led", 6)
+        output.close()
+        self.assertEqual(written, [("led", 6)])
+        self.assertEqual(output.skipped, 1)
+
+
 if __name__ == "__main__":
     unittest.main()
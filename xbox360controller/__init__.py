@@ -1,5 +1,46 @@
+import importlib
+
+from xbox360controller.combo import ComboMatcher
 from xbox360controller.controller import Xbox360Controller
+from xbox360controller.dispatch import Dispatcher
+from xbox360controller.ff import RumblePattern
+from xbox360controller.history import EventHistory
+from xbox360controller.hotplug import HotplugWatcher, enumerate_controllers
+from xbox360controller.reactor import Reactor
+from xbox360controller.record import Recorder, Replayer
 
 __author__ = "Linus Groh"
 __version__ = "1.1.2"
-__all__ = ["Xbox360Controller"]
+__all__ = [
+    "Xbox360Controller",
+    "AsyncXbox360Controller",
+    "ComboMatcher",
+    "Dispatcher",
+    "EventHistory",
+    "EventServer",
+    "HotplugWatcher",
+    "enumerate_controllers",
+    "Reactor",
+    "RemoteController",
+    "Recorder",
+    "Replayer",
+    "RumblePattern",
+    "StatePublisher",
+    "StateReader",
+]
+
+# Imported when first used, asyncio alone takes longer to import than all of
+# the rest
+_LAZY = {
+    "AsyncXbox360Controller": "xbox360controller.aio",
+    "EventServer": "xbox360controller.server",
+    "RemoteController": "xbox360controller.server",
+    "StatePublisher": "xbox360controller.shm",
+    "StateReader": "xbox360controller.shm",
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    return getattr(importlib.import_module(_LAZY[name]), name)
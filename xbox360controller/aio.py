@@ -0,0 +1,118 @@
+"""asyncio support.
+
+`AsyncXbox360Controller` reads its events from the running event loop instead
+of a background thread, so callbacks are run on the loop as well.
+"""
+
+import asyncio
+import os
+
+from xbox360controller.controller import Xbox360Controller
+
+
+class AsyncXbox360Controller(Xbox360Controller):
+    def __init__(self, *args, loop=None, **kwargs):
+        if kwargs.get("reactor") is not None:
+            raise ValueError("a reactor can't be used together with asyncio")
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                raise RuntimeError("pass loop= when no event loop is running") from None
+        self._loop = loop
+        self._reader_fd = None
+        self._queues = set()
+        super().__init__(*args, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _start_reading(self):
+        self._reader_fd = self._input_file.fileno()
+        os.set_blocking(self._reader_fd, False)
+        self._loop.add_reader(self._reader_fd, self._on_loop_readable)
+
+    def _stop_reading(self, join=True):
+        if self._reader_fd is None:
+            return
+        self._loop.remove_reader(self._reader_fd)
+        self._reader_fd = None
+        for queue in self._queues:
+            queue.put_nowait(None)
+
+    def _run_on_reader(self, function):
+        # Readers can only be added and removed from the loop's own thread,
+        # errors end up in the loop's exception handler
+        self._loop.call_soon_threadsafe(function)
+
+    def _on_loop_readable(self):
+        events = None
+        try:
+            if self._queues:
+                # Only decoded for the batches() and events() iterators
+                events = self._read_events()
+            else:
+                size = self._read()
+        except ValueError:
+            # File closed in another thread
+            return
+        except OSError:
+            # Device unplugged
+            self._disconnected()
+            return
+        # Outside of the try, errors of callbacks are no read errors
+        if events is None:
+            self._process_read(size)
+            return
+        if events:
+            self.process_events(events)
+            for queue in self._queues:
+                queue.put_nowait(events)
+
+    def _schedule_flush(self, delay):
+        self._loop.call_later(delay, self._flush_coalesced)
+
+    def _flush_coalesced(self):
+        if self._reader_fd is not None:
+            super()._flush_coalesced()
+
+    def _run_callback(self, callback, target):
+        if self._dispatcher is not None:
+            return super()._run_callback(callback, target)
+        # Only the time until the coroutine is scheduled is counted
+        result = self._call(callback, target)
+        if asyncio.iscoroutine(result):
+            self._loop.create_task(result)
+
+    async def batches(self):
+        queue = asyncio.Queue()
+        self._queues.add(queue)
+        try:
+            while self._reader_fd is not None:
+                events = await queue.get()
+                if events is None:
+                    return
+                yield events
+        finally:
+            self._queues.discard(queue)
+
+    async def events(self):
+        async for events in self.batches():
+            for event in events:
+                yield event
+
+    # Both only issue a few short, non-blocking writes to the device, so they
+    # are run right on the loop instead of paying for a trip to an executor.
+
+    async def set_rumble_async(self, left, right, duration=1000):
+        return self.set_rumble(left, right, duration)
+
+    async def set_led_async(self, status):
+        return self.set_led(status)
+
+    def close(self):
+        self._stop_reading()
+        super().close()
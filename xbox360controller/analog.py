@@ -0,0 +1,136 @@
+"""Processing the analog axes with lookup tables.
+
+Every raw value an axis can report is converted once, up front, into a table
+of up to 65536 entries, so applying calibration, deadzones and response curves
+to an event is a single lookup. The radial deadzone of a stick depends on both
+of its components, it looks up a scale factor by the squared distance from the
+center instead.
+"""
+
+from array import array
+from functools import lru_cache
+from math import copysign, sqrt
+
+TABLE_SIZE = 65536
+
+# Squared distances from the center range from 0 to 2 (in the corners)
+_R2_SCALE = (TABLE_SIZE - 1) / 2
+
+
+def _curve(curve):
+    if callable(curve):
+        return curve
+    if curve <= 0:
+        raise ValueError("curve must be greater than 0")
+    return lambda val: val**curve
+
+
+class AxisResponse:
+    """Calibration offset, deadzone, outer saturation and response curve of
+    a single axis component."""
+
+    def __init__(self, offset=0.0, deadzone=0.0, outer=1.0, curve=1.0):
+        if not -1 < offset < 1:
+            raise ValueError("offset must be in range -1-1")
+        if not 0 <= deadzone < outer <= 1:
+            raise ValueError("deadzone and outer must be 0 <= deadzone < outer <= 1")
+        self.offset = offset
+        self.deadzone = deadzone
+        self.outer = outer
+        self.curve = _curve(curve)
+
+    def __call__(self, val):
+        # Move the center, keeping the ends where they are
+        val -= self.offset
+        val /= 1 - self.offset if val >= 0 else 1 + self.offset
+        mag = abs(val)
+        if mag <= self.deadzone:
+            return 0.0
+        mag = min((mag - self.deadzone) / (self.outer - self.deadzone), 1.0)
+        return copysign(self.curve(mag), val)
+
+
+class RadialDeadzone:
+    """Deadzone, outer saturation and response curve applied to the distance
+    of a stick from its center, keeping its direction."""
+
+    __slots__ = ("index", "components", "scale")
+
+    def __init__(self, index, deadzone=0.0, outer=1.0, curve=1.0):
+        if not 0 <= deadzone < outer <= 1:
+            raise ValueError("deadzone and outer must be 0 <= deadzone < outer <= 1")
+        curve = _curve(curve)
+        self.index = index
+        self.components = [0.0, 0.0]
+        scale = array("d", bytes(8 * TABLE_SIZE))
+        for i in range(TABLE_SIZE):
+            # The largest distance of the entry, so that a saturated stick
+            # never exceeds 1
+            distance = sqrt((i + 1) / _R2_SCALE)
+            if distance > deadzone:
+                mag = min((distance - deadzone) / (outer - deadzone), 1.0)
+                scale[i] = curve(mag) / distance
+        self.scale = scale
+
+    def update(self, index, val, values):
+        """Set a component and store both scaled components in `values`,
+        return the scaled value of the component."""
+        components = self.components
+        components[index - self.index] = val
+        x, y = components
+        r2 = int((x * x + y * y) * _R2_SCALE)
+        factor = self.scale[r2 if r2 < TABLE_SIZE else TABLE_SIZE - 1]
+        values[self.index] = x * factor
+        values[self.index + 1] = y * factor
+        return values[index]
+
+
+class AnalogConfig:
+    def __init__(
+        self, index, deadzone=0.0, outer=1.0, curve=1.0, offset=0.0, radial=False
+    ):
+        offsets = offset if isinstance(offset, (tuple, list)) else (offset, offset)
+        if radial:
+            self.radial = RadialDeadzone(index, deadzone, outer, curve)
+            self.responses = [AxisResponse(offset) for offset in offsets]
+        else:
+            self.radial = None
+            self.responses = [
+                AxisResponse(offset, deadzone, outer, curve) for offset in offsets
+            ]
+
+
+def table_shift(size):
+    """Return how far raw values are shifted right to index a table for
+    `size` raw values, more than TABLE_SIZE share entries."""
+    return max(0, (size - 1).bit_length() - 16)
+
+
+def build_table(minimum, size, offset, scale, clip, transform=None, response=None):
+    """Return the processed values of `size` raw values from `minimum` on.
+
+    Raw values are scaled to -1-1 with `offset` and `scale`, then changed by
+    `transform` and `response`.
+    """
+    if response is None:
+        # Without a response the tables are the same for all controllers
+        return _shared_table(minimum, size, offset, scale, clip, transform)
+    shift = table_shift(size)
+    table = array("d", bytes(8 * (((size - 1) >> shift) + 1)))
+    for i in range(len(table)):
+        val = (minimum + (i << shift) - offset) * scale
+        if clip:
+            val = max(-1.0, min(1.0, val))
+        if transform is not None:
+            val = transform(val)
+        table[i] = response(val)
+    return table
+
+
+@lru_cache(maxsize=None)
+def _shared_table(minimum, size, offset, scale, clip, transform):
+    return build_table(minimum, size, offset, scale, clip, transform, _identity)
+
+
+def _identity(val):
+    return val
@@ -0,0 +1,280 @@
+"""Turning streams of input events into NumPy arrays for analysis.
+
+Needs NumPy, install it with ``pip install xbox360controller[analysis]``.
+Events are decoded from the raw joydev or evdev records, e.g. of a recording,
+into structured arrays without a Python object per event, and resampled to a
+fixed rate by holding the last value of each column. Values are processed with
+the lookup tables of a controller built from the recording's header, so they are
+the same `process_event` sets, including trigger rescaling, the inverted hat and
+the `configure_axis` settings of a controller passed along.
+"""
+
+import os
+import struct
+
+import numpy as np
+
+from xbox360controller.analog import _R2_SCALE, TABLE_SIZE
+from xbox360controller.controller import (
+    BOOT_TIME,
+    EVDEV,
+    JOYDEV,
+    JS_EVENT_SIZE,
+    Xbox360Controller,
+)
+from xbox360controller.evdev import INPUT_EVENT_SIZE
+from xbox360controller.linux.input_event_codes import (
+    EV_ABS,
+    EV_KEY,
+    EV_SYN,
+    SYN_DROPPED,
+    SYN_REPORT,
+)
+from xbox360controller.linux.joystick import JS_EVENT_AXIS, JS_EVENT_BUTTON
+from xbox360controller.record import Header, unpack_header
+from xbox360controller.state import _read_int_pair, _read_pair
+
+# The decoded events of both interfaces, times in seconds like ControllerEvent
+EVENT_DTYPE = np.dtype(
+    [("time", "f8"), ("type", "u2"), ("number", "u2"), ("value", "i4")]
+)
+
+# The records as read from the devices, in native byte order and alignment
+JS_EVENT_DTYPE = np.dtype(
+    {
+        "names": ["time", "value", "type", "number"],
+        "formats": ["=u4", "=i2", "u1", "u1"],
+        "offsets": [0, 4, 6, 7],
+        "itemsize": JS_EVENT_SIZE,
+    }
+)
+_LONG_SIZE = struct.calcsize("l")
+INPUT_EVENT_DTYPE = np.dtype(
+    {
+        "names": ["sec", "usec", "type", "code", "value"],
+        "formats": ["=i{}".format(_LONG_SIZE)] * 2 + ["=u2", "=u2", "=i4"],
+        "offsets": [0, _LONG_SIZE] + [2 * _LONG_SIZE + offset for offset in (0, 2, 4)],
+        "itemsize": INPUT_EVENT_SIZE,
+    }
+)
+
+# Timestamps are at most as precise as microseconds, and lose some more as
+# doubles, events this close after a sample count as happening at it
+_SLACK = 0.5e-6
+
+
+def decode(data, backend=JOYDEV):
+    """Return the events in `data`, raw records of `backend`, as an array of
+    `EVENT_DTYPE`."""
+    if backend == EVDEV:
+        records = np.frombuffer(data, INPUT_EVENT_DTYPE, len(data) // INPUT_EVENT_SIZE)
+        events = np.empty(len(records), EVENT_DTYPE)
+        events["time"] = records["sec"] + records["usec"] / 1000000
+        events["number"] = records["code"]
+    elif backend == JOYDEV:
+        records = np.frombuffer(data, JS_EVENT_DTYPE, len(data) // JS_EVENT_SIZE)
+        events = np.empty(len(records), EVENT_DTYPE)
+        events["time"] = np.round(BOOT_TIME + records["time"] / 1000, 4)
+        events["number"] = records["number"]
+    else:
+        raise ValueError("backend must be {!r} or {!r}".format(JOYDEV, EVDEV))
+    events["type"] = records["type"]
+    events["value"] = records["value"]
+    return events
+
+
+def load(path):
+    """Return the `Header` and the decoded events of a recording."""
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        header, offset = unpack_header(data)
+    except ValueError:
+        raise ValueError("{} is not a controller recording".format(path))
+    size = (len(data) - offset) // header.record_size * header.record_size
+    return header, decode(memoryview(data)[offset : offset + size], header.backend)
+
+
+class _HeaderController(Xbox360Controller):
+    # The controller a header describes, without a device, for its tables
+    def __init__(self, header):
+        self._header = header
+        self._abs_ranges = header.abs_ranges
+        super().__init__(
+            device=os.devnull,
+            event_device=os.devnull,
+            backend=header.backend,
+            raw_mode=header.raw_mode,
+            stats=False,
+            threaded=False,
+        )
+
+    def _open_files(self):
+        self._dev_file = self._open_device(self._device, None, "rb")
+        self._event_file = self._open_device(self._event_device, None, "wb")
+        self.effects.reset(self._event_file)
+        self._led_file = None
+        self.connected = True
+
+    def _probe_capabilities(self):
+        capabilities = super()._probe_capabilities()
+        return capabilities._replace(
+            name=self._header.name,
+            axis_map=self._header.axis_map,
+            button_map=self._header.button_map,
+        )
+
+    def _configure_like(self, controller):
+        # Applies configure_axis() of `controller` with the ranges recorded
+        if controller.backend != self.backend or controller.raw_mode != self.raw_mode:
+            raise ValueError(
+                "recorded with backend={!r}, raw_mode={}".format(
+                    self.backend, self.raw_mode
+                )
+            )
+        axes = {axis.name: axis for axis in self.axes}
+        try:
+            self._analog = {
+                axes[axis.name]: config for axis, config in controller._analog.items()
+            }
+        except KeyError as e:
+            raise ValueError("{} wasn't recorded".format(e.args[0]))
+        self._axis_table = self._build_axis_table()
+        if self._evdev is not None:
+            self._evdev.rebuild()
+
+
+def columns(controller):
+    """Return the names of the values of `controller`'s axes and buttons, by
+    state index: ``axis_l_x``, ``axis_l_y``, ``trigger_l``, ``button_a``...
+    `controller` may also be the `Header` of a recording."""
+    if isinstance(controller, Header):
+        with _HeaderController(controller) as recorded:
+            return columns(recorded)
+    names = [None] * len(controller._state)
+    for name, (index, reader) in controller._state._layout.items():
+        if reader in (_read_pair, _read_int_pair):
+            names[index] = name + "_x"
+            names[index + 1] = name + "_y"
+        else:
+            names[index] = name
+    return names
+
+
+def _button_sources(entries, events, select, store):
+    for number, (hat_index, hat_sign, button) in entries:
+        chosen = select & (events["number"] == number)
+        if hat_index is not None:
+            store(chosen, hat_index, hat_sign * events["value"][chosen])
+        elif button is not None:
+            store(chosen, button._index, events["value"][chosen])
+
+
+def _sources(events, controller):
+    # The state index each event sets and its processed value, -1 for events
+    # that don't change the state, and the radial deadzones to apply
+    index = np.full(len(events), -1, np.intp)
+    value = np.zeros(len(events))
+    radials = set()
+
+    def store(chosen, state_index, values):
+        index[chosen] = state_index
+        value[chosen] = values
+
+    types = events["type"]
+    numbers = events["number"]
+    raw = events["value"]
+    evdev = controller._evdev
+    if evdev is None:
+        # Init events are skipped like process_events() does
+        axes = types == JS_EVENT_AXIS
+        for number, (axis, state_index, table, _, radial) in enumerate(
+            controller._axis_table
+        ):
+            chosen = axes & (numbers == number)
+            table = np.frombuffer(table, "f8")
+            store(chosen, state_index, table[raw[chosen] + 32768])
+            if radial is not None:
+                radials.add(radial)
+        _button_sources(
+            enumerate(controller._button_table),
+            events,
+            types == JS_EVENT_BUTTON,
+            store,
+        )
+        return index, value, radials
+
+    # Frames are applied at their SYN_REPORT, and thrown away entirely after
+    # a SYN_DROPPED and when incomplete
+    reports = (types == EV_SYN) & (numbers == SYN_REPORT)
+    frames = np.cumsum(reports) - reports
+    dropped = np.unique(frames[(types == EV_SYN) & (numbers == SYN_DROPPED)])
+    valid = ~np.isin(frames, dropped) & (frames < np.count_nonzero(reports))
+
+    absolute = valid & (types == EV_ABS)
+    for code, entry in evdev._abs.items():
+        axis, state_index, table, _, radial, minimum, maximum, shift = entry
+        chosen = absolute & (numbers == code)
+        offsets = (np.clip(raw[chosen], minimum, maximum) - minimum) >> shift
+        store(chosen, state_index, np.frombuffer(table, "f8")[offsets])
+        if radial is not None:
+            radials.add(radial)
+    # Key repeats don't change anything
+    keys = valid & (types == EV_KEY) & (raw != 2)
+    _button_sources(evdev._keys.items(), events, keys, store)
+    return index, value, radials
+
+
+def resample(events, header, rate=500.0, start=None, end=None, controller=None):
+    """Return the state of the axes and buttons of the controller `header`
+    describes at `rate` samples per second from `start` to `end` after the
+    decoded `events`.
+
+    The result is a structured array with a ``time`` field and one field per
+    value named like `columns` returns them. Each value is the one set by the
+    last event up to the sample's time, 0 before the first one. The
+    `configure_axis` settings of `controller` apply, which must use the same
+    backend and mode as the recording.
+    """
+    if rate <= 0:
+        raise ValueError("rate must be greater than 0")
+    with _HeaderController(header) as recorded:
+        if controller is not None:
+            recorded._configure_like(controller)
+        return _resample(events, recorded, rate, start, end)
+
+
+def _resample(events, controller, rate, start, end):
+    times = events["time"]
+    if start is None:
+        start = times[0] if len(times) else 0.0
+    if end is None:
+        end = times[-1] if len(times) else start
+    count = int(np.floor((end - start + _SLACK) * rate)) + 1 if end >= start else 0
+    timeline = start + np.arange(count) / rate
+
+    index, value, radials = _sources(events, controller)
+    names = columns(controller)
+    samples = np.zeros((len(names), count))
+    for state_index in range(len(names)):
+        chosen = index == state_index
+        if not chosen.any():
+            continue
+        held = np.searchsorted(times[chosen], timeline + _SLACK, side="right") - 1
+        samples[state_index] = np.where(
+            held >= 0, value[chosen][np.maximum(held, 0)], 0.0
+        )
+
+    for radial in radials:
+        # Both components are known for every sample now
+        x, y = samples[radial.index], samples[radial.index + 1]
+        r2 = np.minimum(((x * x + y * y) * _R2_SCALE).astype(np.intp), TABLE_SIZE - 1)
+        factor = np.frombuffer(radial.scale, "f8")[r2]
+        samples[radial.index] = x * factor
+        samples[radial.index + 1] = y * factor
+
+    result = np.empty(count, [("time", "f8")] + [(name, "f8") for name in names])
+    result["time"] = timeline
+    for name, column in zip(names, samples):
+        result[name] = column
+    return result
@@ -0,0 +1,161 @@
+"""Detecting button chords and sequences.
+
+All registered sequences are compiled into a single automaton (Aho-Corasick
+over the pressed buttons), and chords are looked up by the exact set of held
+buttons, so handling a button edge costs the same no matter how many combos
+are registered. Times are the timestamps of the input events.
+"""
+
+from collections import deque
+
+CHORD = "chord"
+SEQUENCE = "sequence"
+
+
+class Combo:
+    __slots__ = ("kind", "buttons", "callback", "within", "name", "_symbols")
+
+    def __init__(self, kind, buttons, callback, within, name, symbols):
+        self.kind = kind
+        self.buttons = tuple(buttons)
+        self.callback = callback
+        self.within = within
+        self.name = name
+        self._symbols = symbols
+
+    def __repr__(self):
+        return "<Combo {}>".format(
+            self.name or "+".join(button.name for button in self.buttons)
+        )
+
+
+class ComboMatcher:
+    def __init__(self, controller):
+        self.controller = controller
+        self.matches = 0
+        self._symbols = {button: i for i, button in enumerate(controller.buttons)}
+        self._chords = {}
+        self._sequences = []
+        self._held = 0
+        self._pressed_at = [0.0] * len(self._symbols)
+        self._compile()
+        controller._combos = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _resolve(self, buttons):
+        # Buttons may also be given by their attribute name, e.g. "button_a"
+        buttons = [
+            getattr(self.controller, button) if isinstance(button, str) else button
+            for button in buttons
+        ]
+        if not buttons:
+            raise ValueError("a combo needs at least one button")
+        try:
+            return buttons, [self._symbols[button] for button in buttons]
+        except KeyError:
+            raise ValueError("combos can only consist of the controller's buttons")
+
+    def add_chord(self, buttons, callback, within=None, name=None):
+        """Call `callback` when exactly `buttons` are held down, all of them
+        pressed within `within` seconds if given."""
+        buttons, symbols = self._resolve(buttons)
+        symbols = sorted(set(symbols))
+        combo = Combo(CHORD, buttons, callback, within, name, symbols)
+        mask = sum(1 << symbol for symbol in symbols)
+        # Replaced instead of changed, as the thread reading the device might
+        # be looking the chords up right now
+        chords = dict(self._chords)
+        chords[mask] = chords.get(mask, ()) + (combo,)
+        self._chords = chords
+        return combo
+
+    def add_sequence(self, buttons, callback, within=None, name=None):
+        """Call `callback` when `buttons` are pressed one after another, from
+        the first to the last press within `within` seconds if given."""
+        buttons, symbols = self._resolve(buttons)
+        combo = Combo(SEQUENCE, buttons, callback, within, name, symbols)
+        self._sequences.append(combo)
+        self._compile()
+        return combo
+
+    def remove(self, combo):
+        if combo.kind == CHORD:
+            chords = dict(self._chords)
+            for mask, combos in chords.items():
+                if combo in combos:
+                    chords[mask] = tuple(c for c in combos if c is not combo)
+            self._chords = {mask: combos for mask, combos in chords.items() if combos}
+        else:
+            self._sequences.remove(combo)
+            self._compile()
+
+    def _compile(self):
+        # A trie of all sequences, then turned into a complete transition
+        # table using the failure links, so a press is a single lookup
+        goto = [{}]
+        outputs = [()]
+        for combo in self._sequences:
+            state = 0
+            for symbol in combo._symbols:
+                if symbol not in goto[state]:
+                    goto.append({})
+                    outputs.append(())
+                    goto[state][symbol] = len(goto) - 1
+                state = goto[state][symbol]
+            outputs[state] += (combo,)
+
+        trie = [dict(edges) for edges in goto]
+        fail = [0] * len(goto)
+        queue = deque(trie[0].values())
+        while queue:
+            state = queue.popleft()
+            # Shallower states, like the one failed to, are already complete
+            outputs[state] += outputs[fail[state]]
+            for symbol, child in trie[state].items():
+                fail[child] = goto[fail[state]].get(symbol, 0)
+                queue.append(child)
+            for symbol, target in goto[fail[state]].items():
+                goto[state].setdefault(symbol, target)
+
+        length = max((len(combo.buttons) for combo in self._sequences), default=1)
+        # Swapped in at once for the thread reading the device, together with
+        # the current state, the number of presses and their times
+        self._automaton = (goto, outputs, [0, 0], [0.0] * length)
+
+    def _edge(self, button, pressed, time):
+        symbol = self._symbols.get(button)
+        if symbol is None:
+            return
+        if not pressed:
+            self._held &= ~(1 << symbol)
+            return
+
+        self._held |= 1 << symbol
+        self._pressed_at[symbol] = time
+        for combo in self._chords.get(self._held, ()):
+            if combo.within is None or (
+                time - min(self._pressed_at[s] for s in combo._symbols) <= combo.within
+            ):
+                self._matched(combo)
+
+        goto, outputs, cursor, times = self._automaton
+        cursor[0] = state = goto[cursor[0]].get(symbol, 0)
+        times[cursor[1] % len(times)] = time
+        cursor[1] = presses = cursor[1] + 1
+        for combo in outputs[state]:
+            first = times[(presses - len(combo.buttons)) % len(times)]
+            if combo.within is None or time - first <= combo.within:
+                self._matched(combo)
+
+    def _matched(self, combo):
+        self.matches += 1
+        self.controller._run_callback(combo.callback, combo)
+
+    def close(self):
+        if self.controller._combos is self:
+            self.controller._combos = None
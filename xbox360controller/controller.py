@@ -5,21 +5,35 @@ Partly inspired by the following libraries/codes:
 - https://gist.github.com/rdb/8864666
 """
 
+import errno
 import os
 import select
 import struct
 import sys
 import time
+import traceback
 import warnings
 from array import array
 from collections import namedtuple
 from fcntl import ioctl
 from glob import glob
-from threading import Thread, Event
-
+from threading import Thread, Event, Lock, current_thread
+
+from xbox360controller.analog import AnalogConfig, build_table
+from xbox360controller.ff import (
+    MAX_EFFECTS,
+    EffectPool,
+    PatternPlayback,
+    RumblePattern,
+)
+from xbox360controller.hotplug import enumerate_controllers
 from xbox360controller.linux.input import *
 from xbox360controller.linux.input_event_codes import *
 from xbox360controller.linux.joystick import *
+from xbox360controller.output import LED, RUMBLE, OutputWriter
+from xbox360controller.stats import Stats
+from xbox360controller.state import StateStore
+from xbox360controller.wakeup import Waker
 
 LED_PERMISSION_WARNING = """Permission to the LED sysfs file was denied.
 You may run this script as user root or try creating a udev rule containing:
@@ -60,6 +74,32 @@ AXIS_NAMES = {
 
 ControllerEvent = namedtuple("Event", ["time", "type", "number", "value", "is_init"])
 
+Capabilities = namedtuple(
+    "Capabilities",
+    [
+        "name",
+        "driver_version",
+        "axis_map",
+        "button_map",
+        "ff_bits",
+        "ff_effects",
+        "has_rumble",
+        "has_led",
+    ],
+)
+
+# https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/joystick.h#L44-L49
+JS_EVENT_FORMAT = "IhBB"
+JS_EVENT_SIZE = struct.calcsize(JS_EVENT_FORMAT)
+JS_EVENT = struct.Struct(JS_EVENT_FORMAT)
+
+# Interfaces to read input events from
+JOYDEV = "joydev"
+EVDEV = "evdev"
+
+# joydev buffers up to 64 events per client (JS_BUFF_SIZE), so this drains it at once
+READ_BATCH_SIZE = 64
+
 
 def _get_uptime():
     with open("/proc/uptime", "r") as f:
@@ -70,11 +110,40 @@ def _get_uptime():
 BOOT_TIME = time.time() - _get_uptime()
 
 
-class RawAxis:
-    def __init__(self, name):
+def _rescale_trigger(val):
+    return (val + 1) / 2
+
+
+def _invert_hat(val):
+    return int(val * -1)
+
+
+class _BaseAxis:
+    __slots__ = (
+        "name",
+        "when_moved",
+        "coalesce_window",
+        "merged",
+        "_pending",
+        "_last_callback",
+        "_store",
+        "_index",
+    )
+
+    _size = 1
+
+    def __init__(self, name, store=None, kind="value"):
         self.name = name
-        self._value = 0
         self.when_moved = None
+        # Minimum time between two when_moved callbacks in seconds, events in
+        # between are merged into a single callback seeing the latest value
+        self.coalesce_window = 0
+        # Number of events merged into the current callback
+        self.merged = 0
+        self._pending = 0
+        self._last_callback = 0
+        self._store = store if store is not None else StateStore()
+        self._index = self._store.allocate(name, self._size, kind)
 
     def __repr__(self):
         return "<xbox360controller.{cls} ({name})>".format(
@@ -82,45 +151,82 @@ class RawAxis:
         )
 
     @property
-    def value(self):
-        return self._value
+    def max_rate(self):
+        if not self.coalesce_window:
+            return None
+        return 1 / self.coalesce_window
+
+    @max_rate.setter
+    def max_rate(self, rate):
+        if rate is not None and rate <= 0:
+            raise ValueError("max_rate must be greater than 0")
+        self.coalesce_window = 1 / rate if rate else 0
 
     def run_callback(self):
         if self.when_moved is not None and callable(self.when_moved):
             self.when_moved(self)
 
 
-class Axis:
-    def __init__(self, name):
-        self.name = name
-        self._value_x = 0
-        self._value_y = 0
-        self.when_moved = None
+class RawAxis(_BaseAxis):
+    __slots__ = ()
 
-    def __repr__(self):
-        return "<xbox360controller.{cls} ({name})>".format(
-            cls=self.__class__.__name__, name=self.name
-        )
+    @property
+    def value(self):
+        return self._store.values[self._index]
+
+    @property
+    def _value(self):
+        return self._store.values[self._index]
+
+    @_value.setter
+    def _value(self, value):
+        self._store.values[self._index] = value
+
+
+class Axis(_BaseAxis):
+    __slots__ = ("_type",)
+
+    _size = 2
+
+    def __init__(self, name, store=None, integer=False):
+        # The hat only ever reports -1, 0 or 1
+        self._type = int if integer else float
+        super().__init__(name, store, "int_pair" if integer else "pair")
 
     @property
     def x(self):
-        return self._value_x
+        return self._type(self._store.values[self._index])
 
     @property
     def y(self):
-        return self._value_y
+        return self._type(self._store.values[self._index + 1])
 
-    def run_callback(self):
-        if self.when_moved is not None and callable(self.when_moved):
-            self.when_moved(self)
+    @property
+    def _value_x(self):
+        return self.x
+
+    @_value_x.setter
+    def _value_x(self, value):
+        self._store.values[self._index] = value
+
+    @property
+    def _value_y(self):
+        return self.y
+
+    @_value_y.setter
+    def _value_y(self, value):
+        self._store.values[self._index + 1] = value
 
 
 class Button:
-    def __init__(self, name):
+    __slots__ = ("name", "when_pressed", "when_released", "_store", "_index")
+
+    def __init__(self, name, store=None):
         self.name = name
-        self._value = False
         self.when_pressed = None
         self.when_released = None
+        self._store = store if store is not None else StateStore()
+        self._index = self._store.allocate(name, 1, "bool")
 
     def __repr__(self):
         return "<xbox360controller.{cls} ({name})>".format(
@@ -129,7 +235,15 @@ class Button:
 
     @property
     def is_pressed(self):
-        return bool(self._value)
+        return bool(self._store.values[self._index])
+
+    @property
+    def _value(self):
+        return self.is_pressed
+
+    @_value.setter
+    def _value(self, value):
+        self._store.values[self._index] = value
 
 
 class Xbox360Controller:
@@ -151,44 +265,68 @@ class Xbox360Controller:
     LED_BLINK_SLOW = 14
     LED_BLINK_ONCE_PREV = 15
 
-    @classmethod
-    def get_available(cls):
-        return [cls(index) for index in range(len(glob("/dev/input/js*")))]
+    # Ranges of the evdev axes by code, None to ask the device for them
+    _abs_ranges = None
 
-    def __init__(self, index=0, axis_threshold=0.2, raw_mode=False, event_timeout=1.0):
+    @classmethod
+    def get_available(cls, **kwargs):
+        return [cls(info.index, **kwargs) for info in enumerate_controllers()]
+
+    def __init__(
+        self,
+        index=0,
+        axis_threshold=0.2,
+        raw_mode=False,
+        event_timeout=1.0,
+        reactor=None,
+        dispatcher=None,
+        backend=JOYDEV,
+        device=None,
+        event_device=None,
+        output_rate=None,
+        stats=True,
+        threaded=True,
+    ):
         self.index = index
         self.axis_threshold = axis_threshold
         self.raw_mode = raw_mode
         self.event_timeout = event_timeout
-        self._ff_id = -1
-
-        try:
-            self._dev_file = open(self._get_dev_file(), "rb")
-        except FileNotFoundError:
-            raise Exception(
-                "controller device with index {index} "
-                "was not found!".format(index=index)
-            )
-
-        self._event_file = open(self._get_event_file(), "wb")
-
-        self._led_file = None
-        try:
-            self._led_file = open(self._get_led_file(), "w")
-        except PermissionError:
-            warnings.warn(LED_PERMISSION_WARNING, UserWarning)
-        except FileNotFoundError:
-            warnings.warn(LED_SUPPORT_WARNING, UserWarning)
-
+        if backend not in (JOYDEV, EVDEV):
+            raise ValueError("backend must be either 'joydev' or 'evdev'")
+        self.backend = backend
+        self._device = device
+        self._event_device = event_device
+
+        self.read_calls = 0
+        self.read_records = 0
+        self._stats = Stats() if stats else None
+        if not threaded and reactor is not None:
+            raise ValueError("a controller without thread can't use a reactor")
+        self.threaded = threaded
+        self._callbacks_enabled = True
+        # Errors of callbacks run by poll(), raised once the batch is applied
+        self._poll_errors = None
+
+        self._connection_lock = Lock()
+        self._closed = False
+        self.connected = False
+        self.effects = EffectPool(size=MAX_EFFECTS)
+        self._pattern = None
+        self._open_files()
+
+        # Queried once, as the device doesn't change until it is reconnected
+        self.capabilities = self._probe_capabilities()
+
+        self._state = StateStore()
         if raw_mode:
             self.axes = self._get_axes()
             self.buttons = self._get_buttons()
         else:
-            self.axis_l = Axis("axis_l")
-            self.axis_r = Axis("axis_r")
-            self.hat = Axis("hat")
-            self.trigger_l = RawAxis("trigger_l")
-            self.trigger_r = RawAxis("trigger_r")
+            self.axis_l = Axis("axis_l", self._state)
+            self.axis_r = Axis("axis_r", self._state)
+            self.hat = Axis("hat", self._state, integer=True)
+            self.trigger_l = RawAxis("trigger_l", self._state)
+            self.trigger_r = RawAxis("trigger_r", self._state)
             self.axes = [
                 self.axis_l,
                 self.axis_r,
@@ -197,17 +335,17 @@ class Xbox360Controller:
                 self.trigger_r,
             ]
 
-            self.button_a = Button("button_a")
-            self.button_b = Button("button_b")
-            self.button_x = Button("button_x")
-            self.button_y = Button("button_y")
-            self.button_trigger_l = Button("button_trigger_l")
-            self.button_trigger_r = Button("button_trigger_r")
-            self.button_select = Button("button_select")
-            self.button_start = Button("button_start")
-            self.button_mode = Button("button_mode")
-            self.button_thumb_l = Button("button_thumb_l")
-            self.button_thumb_r = Button("button_thumb_r")
+            self.button_a = Button("button_a", self._state)
+            self.button_b = Button("button_b", self._state)
+            self.button_x = Button("button_x", self._state)
+            self.button_y = Button("button_y", self._state)
+            self.button_trigger_l = Button("button_trigger_l", self._state)
+            self.button_trigger_r = Button("button_trigger_r", self._state)
+            self.button_select = Button("button_select", self._state)
+            self.button_start = Button("button_start", self._state)
+            self.button_mode = Button("button_mode", self._state)
+            self.button_thumb_l = Button("button_thumb_l", self._state)
+            self.button_thumb_r = Button("button_thumb_r", self._state)
             self.buttons = [
                 self.button_a,
                 self.button_b,
@@ -222,9 +360,31 @@ class Xbox360Controller:
                 self.button_thumb_r,
             ]
 
+        self._values = self._state.values
+        self._analog = {}
+        self._axis_table = self._build_axis_table()
+        self._button_table = self._build_button_table()
+
+        # Get the raw events of each read, e.g. a Recorder
+        self._taps = ()
+        self._combos = None
+        self._open_input()
+
+        self.output = None
+        if output_rate is not None:
+            self.output = OutputWriter(self, output_rate)
+
+        self._dispatcher = dispatcher
+        self._coalesced_axes = set()
+        self._reactor = reactor
+        self._event_thread = None
         self._event_thread_stopped = Event()
-        self._event_thread = Thread(target=self._event_loop)
-        self._event_thread.start()
+        # Threads stopped without waiting for them, joined by close() before
+        # the waker they wait on is closed
+        self._stopped_threads = []
+        # Wakes the thread reading the device, which waits without a timeout
+        self._waker = Waker()
+        self._start_reading()
 
     def __enter__(self):
         return self
@@ -232,10 +392,114 @@ class Xbox360Controller:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
+    def _open_files(self):
+        try:
+            # Unbuffered, so a single read() returns whatever joydev has pending
+            self._dev_file = self._open_device(self._device, self._get_dev_file, "rb")
+        except FileNotFoundError:
+            raise Exception(
+                "controller device with index {index} "
+                "was not found!".format(index=self.index)
+            )
+
+        self._event_file = self._open_device(
+            self._event_device, self._get_event_file, "wb"
+        )
+        self.effects.reset(self._event_file)
+
+        self._led_file = None
+        try:
+            self._led_file = open(self._get_led_file(), "w")
+        except PermissionError:
+            warnings.warn(LED_PERMISSION_WARNING, UserWarning)
+        except FileNotFoundError:
+            warnings.warn(LED_SUPPORT_WARNING, UserWarning)
+
+        self.connected = True
+
+    def _open_input(self):
+        self._evdev = None
+        if self.backend == EVDEV:
+            from xbox360controller.evdev import INPUT_EVENT_SIZE, EvdevInput
+
+            self._evdev = EvdevInput(
+                self,
+                self._open_device(self._event_device, self._get_event_file, "rb"),
+                self._abs_ranges,
+            )
+            self._input_file = self._evdev.file
+            self._record_size = INPUT_EVENT_SIZE
+        else:
+            self._input_file = self._dev_file
+            self._record_size = JS_EVENT_SIZE
+        self._read_buf = bytearray(self._record_size * READ_BATCH_SIZE)
+        self._read_view = memoryview(self._read_buf)
+        # The fields of joydev records are read through views of the buffer
+        self._read_words = self._read_view.cast("I")
+        self._read_shorts = self._read_view.cast("h")
+        # Offset and size of the start of a record the last read ended with,
+        # streams like the socket of a RemoteController can split records
+        self._partial_start = 0
+        self._partial_size = 0
+        if self._stats is not None:
+            self._stats.event_times = self._evdev is not None
+
+    def _close_files(self):
+        self._dev_file.close()
+        self._input_file.close()
+        self._event_file.close()
+        if self._led_file is not None:
+            self._led_file.close()
+
+    def _disconnected(self):
+        # Called when the device is gone, from the thread reading it or from
+        # a HotplugWatcher
+        with self._connection_lock:
+            if not self.connected:
+                return
+            self.connected = False
+            # The thread reading the device might be the one calling this
+            self._stop_reading(join=False)
+            # A looping pattern would keep playing on the next file otherwise
+            self.stop_pattern()
+            self._close_files()
+
+    def _run_on_reader(self, function):
+        # Runs `function`, e.g. reconnect(), for a HotplugWatcher where the
+        # device is read, any thread can do for the threads reading it
+        function()
+
+    def reconnect(self):
+        with self._connection_lock:
+            # Whatever was playing is gone with the old file
+            self.stop_pattern()
+            if self.connected:
+                self._stop_reading()
+                self._close_files()
+            self._open_files()
+            self.capabilities = self._probe_capabilities()
+            for index in range(len(self._values)):
+                self._values[index] = 0
+            self._state.publish()
+            self._open_input()
+            if self.output is not None:
+                self.output.reset()
+            self._start_reading()
+
+    @staticmethod
+    def _open_device(device, get_path, mode):
+        # device may be a path or an already opened file, e.g. for testing
+        if device is not None and not isinstance(device, str):
+            return device
+        path = device if device is not None else get_path()
+        return open(path, mode, buffering=0)
+
     def _get_dev_file(self):
         return "/dev/input/js{idx}".format(idx=self.index)
 
     def _get_event_file(self):
+        if isinstance(self._event_device, str):
+            return self._event_device
         event_file_sysfs = glob(
             "/sys/class/input/js{idx}/device/event*".format(idx=self.index)
         )[0]
@@ -247,39 +511,113 @@ class Xbox360Controller:
 
     def _get_axes(self):
         axes = []
-        buf = array("B", [0] * 64)
-        ioctl(self._dev_file, JSIOCGAXMAP, buf)
-        for axis in buf[: self.num_axes]:
+        for axis in self.axis_map:
             name = AXIS_NAMES.get(axis)
             if name is not None:
                 name = name.lower()
-                setattr(self, name, RawAxis(name))
+                setattr(self, name, RawAxis(name, self._state))
                 axes.append(getattr(self, name))
         return axes
 
     def _get_buttons(self):
         buttons = []
-        buf = array("H", [0] * 200)
-        ioctl(self._dev_file, JSIOCGBTNMAP, buf)
-        for button in buf[: self.num_buttons]:
+        for button in self.button_map:
             name = BUTTON_NAMES.get(button)
             if name is not None:
                 name = name.lower()
-                setattr(self, name, Button(name))
+                setattr(self, name, Button(name, self._state))
                 buttons.append(getattr(self, name))
         return buttons
 
-    def _event_loop(self):
-        while not self._event_thread_stopped.is_set():
-            event = self.get_event()
-            if event is not None and not event.is_init:
-                self.process_event(event)
+    def _start_reading(self):
+        if not self.threaded:
+            # Read by poll(), which must never wait for the device
+            os.set_blocking(self._input_file.fileno(), False)
+        elif self._reactor is not None:
+            self._reactor._register(self)
+        else:
+            self._event_thread_stopped = Event()
+            self._event_thread = Thread(
+                target=self._event_loop, args=(self._event_thread_stopped,)
+            )
+            self._event_thread.start()
+
+    def _stop_reading(self, join=True):
+        if self._reactor is not None:
+            self._reactor._unregister(self)
+        self._event_thread_stopped.set()
+        if self._event_thread is not None:
+            self._waker.wake()
+            if join and self._event_thread is not current_thread():
+                self._event_thread.join()
+            else:
+                self._stopped_threads = [
+                    thread for thread in self._stopped_threads if thread.is_alive()
+                ]
+                self._stopped_threads.append(self._event_thread)
+            self._event_thread = None
+
+    def _event_loop(self, stopped):
+        while not stopped.is_set():
+            try:
+                # Only wakes up for input, to flush coalesced axes or to stop
+                size = self._read() if self._wait(self._flush_timeout()) else 0
+            except ValueError:
+                # File closed in main thread
+                continue
+            except OSError as e:
+                if stopped.is_set():
+                    # File closed in main thread while waiting for input
+                    return
+                if e.errno == errno.ENODEV:
+                    # Controller unplugged
+                    self._disconnected()
+                    return
+                raise
+            # Outside of the try, errors of callbacks are no read errors
+            self._process_read(size)
+            if self._coalesced_axes:
+                self._flush_coalesced()
+
+    def poll(self, callbacks=True):
+        if self.threaded:
+            raise RuntimeError("poll() needs a controller with threaded=False")
+        if not self.connected:
+            return 0
+
+        count = 0
+        self._callbacks_enabled = callbacks
+        self._poll_errors = errors = []
+        try:
+            while True:
+                try:
+                    size = self._read()
+                except OSError as e:
+                    if e.errno == errno.ENODEV:
+                        # Controller unplugged
+                        self._disconnected()
+                        break
+                    raise
+                read = self._process_read(size)
+                count += read
+                # A buffer that wasn't filled up means nothing is pending,
+                # a failed callback leaves the rest for the next poll()
+                if read < READ_BATCH_SIZE or errors:
+                    break
+            if self._coalesced_axes:
+                self._flush_coalesced()
+        finally:
+            self._callbacks_enabled = True
+            self._poll_errors = None
+        if errors:
+            raise errors[0]
+        return count
 
     def get_event(self):
         try:
             r, w, e = select.select([self._dev_file], [], [], self.event_timeout)
             if self._dev_file in r:
-                buf = self._dev_file.read(8)
+                buf = self._dev_file.read(JS_EVENT_SIZE)
             else:
                 return
         except ValueError:
@@ -287,107 +625,439 @@ class Xbox360Controller:
             return
         else:
             if buf:
-                time_, value, type_, number = struct.unpack("IhBB", buf)
+                time_, value, type_, number = struct.unpack(JS_EVENT_FORMAT, buf)
                 time_ = round(BOOT_TIME + (time_ / 1000), 4)
                 is_init = bool(type_ & JS_EVENT_INIT)
                 return ControllerEvent(
                     time=time_, type=type_, number=number, value=value, is_init=is_init
                 )
 
-    def axis_callback(self, axis, val):
+    def get_events(self, timeout=None):
+        if timeout is None:
+            timeout = self.event_timeout
+        try:
+            if not self._wait(timeout):
+                return []
+            return self._read_events()
+        except ValueError:
+            # File closed in main thread
+            return []
+
+    def _wait(self, timeout):
+        # Whether the device is readable within `timeout` seconds, or before
+        # being woken up
+        if self._stats is not None:
+            self._stats.syscalls += 1
+        try:
+            r, w, e = select.select([self._input_file, self._waker], [], [], timeout)
+        except ValueError:
+            # File closed in main thread
+            return False
+        if self._waker in r:
+            self._waker.clear()
+        return self._input_file in r
+
+    def _read(self):
+        # Reads a batch of records into the buffer, returns their size
+        kept = self._partial_size
+        if kept:
+            # Continued after the start of the record split by the last read
+            start = self._partial_start
+            self._read_view[:kept] = self._read_view[start : start + kept]
+            self._partial_start = 0
+            size = self._input_file.readinto(self._read_view[kept:])
+        else:
+            size = self._input_file.readinto(self._read_buf)
+        stats = self._stats
+        if stats is not None:
+            stats.syscalls += 1
+        if size is None:
+            # Nothing pending on a non-blocking file
+            return 0
+        if not size:
+            # End of file, e.g. the other end of a pipe or socket closed
+            raise OSError(errno.ENODEV, os.strerror(errno.ENODEV))
+        size += kept
+        self._partial_size = size % self._record_size
+        size -= self._partial_size
+        self._partial_start = size
+        self.read_calls += 1
+        self.read_records += size // self._record_size
+        if self._taps:
+            view = self._read_view[:size]
+            for tap in self._taps:
+                tap.write(view)
+        if stats is not None and size:
+            if stats.event_times:
+                sec, usec = struct.unpack_from("2l", self._read_buf)
+                stats.read(size // self._record_size, sec + usec / 1000000)
+            else:
+                stats.read(size // self._record_size)
+        return size
+
+    def _read_events(self):
+        size = self._read()
+        if not size:
+            return []
+        return self._decode(self._read_view[:size])
+
+    def _process_read(self, size):
+        # Like process_events() for the `size` bytes _read() returned, but
+        # joydev records are handed to the tables as plain numbers without
+        # creating an event object
+        if not size:
+            return 0
+        if self._evdev is not None:
+            self._evdev.process(self._evdev.decode(self._read_view[:size]))
+            return size // self._record_size
+
+        state = self._state
+        process_button = self._process_button
+        process_axis = self._process_axis
+        # The value, type and number of each js_event, zip() reuses its tuple
+        values = self._read_shorts[2 : size // 2 : 4]
+        types = self._read_view[6:size:JS_EVENT_SIZE]
+        numbers = self._read_view[7:size:JS_EVENT_SIZE]
+        # Init events are skipped like process_events() does
+        if self._combos is not None:
+            # Combos need the time of each edge
+            times = self._read_words[: size // 4 : 2]
+            for time_, value, type_, number in zip(times, values, types, numbers):
+                if type_ == JS_EVENT_AXIS:
+                    state.time = round(BOOT_TIME + (time_ / 1000), 4)
+                    process_axis(number, value)
+                elif type_ == JS_EVENT_BUTTON:
+                    state.time = round(BOOT_TIME + (time_ / 1000), 4)
+                    process_button(number, value)
+        else:
+            # Read at once, so the events share the time of the last one
+            time_ = self._read_words[size // 4 - 2]
+            state.time = round(BOOT_TIME + (time_ / 1000), 4)
+            for value, type_, number in zip(values, types, numbers):
+                if type_ == JS_EVENT_AXIS:
+                    process_axis(number, value)
+                elif type_ == JS_EVENT_BUTTON:
+                    process_button(number, value)
+        state.publish()
+        return size // JS_EVENT_SIZE
+
+    def _decode(self, view):
+        if self._evdev is not None:
+            return self._evdev.decode(view)
+        return [
+            ControllerEvent(
+                time=round(BOOT_TIME + (time_ / 1000), 4),
+                type=type_,
+                number=number,
+                value=value,
+                is_init=bool(type_ & JS_EVENT_INIT),
+            )
+            for time_, value, type_, number in JS_EVENT.iter_unpack(view)
+        ]
+
+    @property
+    def records_per_read(self):
+        if not self.read_calls:
+            return 0.0
+        return self.read_records / self.read_calls
+
+    def _run_callback(self, callback, target):
+        if not self._callbacks_enabled:
+            return
+        if self._dispatcher is not None:
+            # Timed on the worker like on the thread reading the device, only
+            # the callbacks of an axis may be coalesced as they read its state
+            self._dispatcher.submit(
+                callback,
+                target,
+                self._timed_call,
+                coalesce=isinstance(target, _BaseAxis),
+            )
+        else:
+            self._call(callback, target)
+
+    def _call(self, callback, target):
+        try:
+            return self._timed_call(callback, target)
+        except Exception as e:
+            if not self.threaded:
+                if self._poll_errors is None:
+                    raise
+                # Raised from poll() after the rest of the batch
+                self._poll_errors.append(e)
+                return None
+            # Printed, as from the thread reading the device, which goes on
+            # with the rest of the batch
+            traceback.print_exc()
+
+    def _timed_call(self, callback, target):
+        stats = self._stats
+        if stats is None:
+            return callback(target)
+        start = time.time()
+        result = callback(target)
+        end = time.time()
+        stats.callback_duration.add(end - start)
+        if end - start > stats.slow_callback or stats.trace is not None:
+            stats.slow_call(callback, target, self._state.time, start, end)
+        return result
+
+    @property
+    def trace(self):
+        return self._stats.trace if self._stats is not None else None
+
+    @trace.setter
+    def trace(self, value):
+        if self._stats is None:
+            raise RuntimeError("stats are disabled for this controller")
+        self._stats.trace = value
+
+    def stats(self, reset=False):
+        if self._stats is None:
+            raise RuntimeError("stats are disabled for this controller")
+        stats = self._stats.as_dict()
+        if self._dispatcher is not None:
+            dispatcher = self._dispatcher
+            stats["dispatcher"] = {
+                "submitted": dispatcher.submitted,
+                "dropped": dispatcher.dropped,
+                "coalesced": dispatcher.coalesced,
+                "errors": dispatcher.errors,
+                "queue_depth": dispatcher.queue_depth,
+                "max_depth": dispatcher.max_depth,
+                "callback_duration": dispatcher.callback_duration.as_dict(),
+            }
+            stats["drops"] += dispatcher.dropped
+        if reset:
+            self._stats.reset()
+        return stats
+
+    def axis_callback(self, axis, val, coalesce=True):
         if (
             axis.when_moved is not None
             and abs(val) > self.axis_threshold
             and callable(axis.when_moved)
         ):
-            axis.when_moved(axis)
+            if coalesce and axis.coalesce_window:
+                now = time.monotonic()
+                if now - axis._last_callback < axis.coalesce_window:
+                    axis._pending += 1
+                    if axis not in self._coalesced_axes:
+                        self._coalesced_axes.add(axis)
+                        self._schedule_flush(
+                            axis._last_callback + axis.coalesce_window - now
+                        )
+                    return
+                axis._last_callback = now
+            self._coalesced_axes.discard(axis)
+            axis.merged = axis._pending
+            axis._pending = 0
+            self._run_callback(axis.when_moved, axis)
+
+    def _schedule_flush(self, delay):
+        # The reader loops wait no longer than _flush_timeout() anyway
+        pass
+
+    def _flush_timeout(self):
+        if not self._coalesced_axes:
+            return None
+        now = time.monotonic()
+        return max(
+            0,
+            min(
+                axis._last_callback + axis.coalesce_window - now
+                for axis in self._coalesced_axes
+            ),
+        )
 
-    def process_event(self, event):
+    def _flush_coalesced(self):
+        now = time.monotonic()
+        for axis in list(self._coalesced_axes):
+            if now - axis._last_callback >= axis.coalesce_window:
+                self._coalesced_axes.discard(axis)
+                axis._last_callback = now
+                # The last pending event is the one being delivered
+                axis.merged = axis._pending - 1
+                axis._pending = 0
+                if axis.when_moved is not None and callable(axis.when_moved):
+                    self._run_callback(axis.when_moved, axis)
+
+    def _axis_entries(self):
+        # (axis, state index, transformation) of each joydev axis number
+        if self.raw_mode:
+            return [(axis, axis._index, None) for axis in self.axes]
+        return [
+            (self.axis_l, self.axis_l._index, None),
+            (self.axis_l, self.axis_l._index + 1, None),
+            (self.trigger_l, self.trigger_l._index, _rescale_trigger),
+            (self.axis_r, self.axis_r._index, None),
+            (self.axis_r, self.axis_r._index + 1, None),
+            (self.trigger_r, self.trigger_r._index, _rescale_trigger),
+            (self.hat, self.hat._index, int),
+            (self.hat, self.hat._index + 1, _invert_hat),
+        ]
+
+    def _build_axis_table(self):
+        # Maps an axis event's number to
+        # (axis, state index, table, callback table, radial deadzone)
+        return [
+            (axis, index)
+            # joydev reports every axis in range -32767-32767
+            + self._lookup_tables(
+                axis, index, transform, -32768, 65536, 0, 1 / 32767, False
+            )
+            for axis, index, transform in self._axis_entries()
+        ]
+
+    def _lookup_tables(
+        self, axis, index, transform, minimum, size, offset, scale, clip
+    ):
+        # The table holds the state value of every raw value, the callback
+        # table the value compared to the axis threshold. Unless configured
+        # with configure_axis() that's the unprocessed value, and with a
+        # radial deadzone the value from update() instead.
+        config = self._analog.get(axis)
+        if config is None:
+            return (
+                build_table(minimum, size, offset, scale, clip, transform),
+                build_table(minimum, size, offset, scale, clip),
+                None,
+            )
+        response = config.responses[index - axis._index]
+        table = build_table(minimum, size, offset, scale, clip, transform, response)
+        return table, (table if config.radial is None else None), config.radial
+
+    def _event_keys(self, names):
+        # (type, number) of the input events of the named axes and buttons,
+        # and with evdev of all synchronization events
+        evdev = self._evdev
+        if evdev is not None:
+            keys = {(EV_SYN, code) for code in range(16)}
+            for code, entry in evdev._abs.items():
+                if entry[0].name in names:
+                    keys.add((EV_ABS, code))
+            key_table = evdev._keys.items()
+            key_type = EV_KEY
+        else:
+            keys = set()
+            for number, entry in enumerate(self._axis_table):
+                if entry[0].name in names:
+                    keys.add((JS_EVENT_AXIS, number))
+            key_table = enumerate(self._button_table)
+            key_type = JS_EVENT_BUTTON
+        for number, (hat_index, _, button) in key_table:
+            if (button is not None and button.name in names) or (
+                hat_index is not None and "hat" in names
+            ):
+                keys.add((key_type, number))
+        return keys
+
+    def configure_axis(
+        self, axis, deadzone=0.0, outer=1.0, curve=1.0, offset=0.0, radial=None
+    ):
+        if isinstance(axis, str):
+            axis = getattr(self, axis)
+        if not self.raw_mode and axis is self.hat:
+            raise ValueError("the hat can't be configured")
+        if radial is None:
+            radial = isinstance(axis, Axis)
+        elif radial and not isinstance(axis, Axis):
+            raise ValueError("only an Axis with x and y can have a radial deadzone")
+
+        self._analog[axis] = AnalogConfig(
+            axis._index, deadzone, outer, curve, offset, radial
+        )
+        # Replaced at once for the thread reading the device
+        self._axis_table = self._build_axis_table()
+        if self._evdev is not None:
+            self._evdev.rebuild()
+
+    def _build_button_table(self):
+        # Maps a button event's number to (hat state index, hat sign, button),
+        # some controllers report the hat as buttons 11-14
+        table = [(None, 0, button) for button in self.buttons]
+        if not self.raw_mode:
+            table.extend([(None, 0, None)] * (15 - len(table)))
+            table[11] = (self.hat._index, -1, None)
+            table[12] = (self.hat._index, 1, None)
+            table[13] = (self.hat._index + 1, 1, None)
+            table[14] = (self.hat._index + 1, -1, None)
+        return table
+
+    def _process_button(self, number, value):
+        try:
+            hat_index, hat_sign, button = self._button_table[number]
+        except IndexError:
+            return
+
+        if hat_index is not None:
+            val = hat_sign * int(value)
+            self._values[hat_index] = val
+            # Button edges are never coalesced
+            self.axis_callback(self.hat, val, coalesce=False)
+
+        if button is None:
+            return
+
+        self._values[button._index] = value
+        self._button_callback(button, value)
+
+    def _button_callback(self, button, value):
+        if self._combos is not None:
+            self._combos._edge(button, value, self._state.time)
+        if value:
+            if button.when_pressed is not None and callable(button.when_pressed):
+                self._run_callback(button.when_pressed, button)
+        elif button.when_released is not None and callable(button.when_released):
+            self._run_callback(button.when_released, button)
+
+    def _process_axis(self, number, value):
+        try:
+            axis, index, table, callback_table, radial = self._axis_table[number]
+        except IndexError:
+            return
+
+        value += 32768
+        if radial is None:
+            self._values[index] = table[value]
+            self.axis_callback(axis, callback_table[value])
+        else:
+            self.axis_callback(axis, radial.update(index, table[value], self._values))
+
+    def _process(self, event):
         if event.type == JS_EVENT_BUTTON:
+            self._process_button(event.number, event.value)
+        elif event.type == JS_EVENT_AXIS:
+            self._process_axis(event.number, event.value)
 
-            if event.number >= 11 and event.number <= 14:
-                if event.number == 11:
-                    self.hat._value_x = -int(event.value)
-                    val = self.hat._value_x
-                if event.number == 12:
-                    self.hat._value_x = int(event.value)
-                    val = self.hat._value_x
-                if event.number == 13:
-                    self.hat._value_y = int(event.value)
-                    val = self.hat._value_y
-                if event.number == 14:
-                    self.hat._value_y = -int(event.value)
-                    val = self.hat._value_y
-
-                self.axis_callback(self.hat, val)
+    def process_event(self, event):
+        if self._evdev is not None:
+            self._evdev.process([event])
+            return
+        # Set first, so that combos see the time of the event
+        self._state.time = event.time
+        self._process(event)
+        self._state.publish()
+
+    def process_events(self, events):
+        if self._evdev is not None:
+            self._evdev.process(events)
+            return
+        for event in events:
+            if not event.is_init:
+                self._state.time = event.time
+                self._process(event)
+        self._state.publish()
 
-            try:
-                button = self.buttons[event.number]
-            except IndexError:
-                return
-            else:
-                button._value = event.value
-
-                if (
-                    button._value
-                    and button.when_pressed is not None
-                    and callable(button.when_pressed)
-                ):
-                    button.when_pressed(button)
-
-                if (
-                    not button._value
-                    and button.when_released is not None
-                    and callable(button.when_released)
-                ):
-                    button.when_released(button)
-
-        if event.type == JS_EVENT_AXIS:
-            if self.raw_mode:
-                try:
-                    axis = self.axes[event.number]
-                except IndexError:
-                    return
-                else:
-                    val = event.value / 32767
-                    axis._value = val
+    def snapshot(self):
+        return self._state.snapshot()
 
-            else:
-                num = event.number
-                val = event.value / 32767
-
-                if num == 0:
-                    self.axis_l._value_x = val
-                if num == 1:
-                    self.axis_l._value_y = val
-                if num == 2:
-                    self.trigger_l._value = (val + 1) / 2
-                if num == 3:
-                    self.axis_r._value_x = val
-                if num == 4:
-                    self.axis_r._value_y = val
-                if num == 5:
-                    self.trigger_r._value = (val + 1) / 2
-                if num == 6:
-                    self.hat._value_x = int(val)
-                if num == 7:
-                    self.hat._value_y = int(val * -1)
-
-                axis = [
-                    self.axis_l,
-                    self.axis_l,
-                    self.trigger_l,
-                    self.axis_r,
-                    self.axis_r,
-                    self.trigger_r,
-                    self.hat,
-                    self.hat,
-                ][num]
-
-            self.axis_callback(axis, val)
+    def _query_name(self):
+        buf = array("B", [0] * 64)
+        ioctl(self._dev_file, JSIOCGNAME(len(buf)), buf)
+        return buf.tobytes().rstrip(b"\0").decode()
 
-    @property
-    def driver_version(self):
+    def _query_driver_version(self):
         buf = array("i", [0])
         ioctl(self._dev_file, JSIOCGVERSION, buf)
         version_dev = struct.unpack("i", buf.tobytes())[0]
@@ -400,29 +1070,81 @@ class Xbox360Controller:
 
         return version_dev, version_ev
 
+    def _query_axis_map(self):
+        buf = array("B", [0])
+        ioctl(self._dev_file, JSIOCGAXES, buf)
+        count = buf[0]
+        buf = array("B", [0] * 64)
+        ioctl(self._dev_file, JSIOCGAXMAP, buf)
+        return tuple(buf[:count])
+
+    def _query_button_map(self):
+        buf = array("B", [0])
+        ioctl(self._dev_file, JSIOCGBUTTONS, buf)
+        count = buf[0]
+        buf = array("H", [0] * 200)
+        ioctl(self._dev_file, JSIOCGBTNMAP, buf)
+        return tuple(buf[:count])
+
+    def _query_ff_bits(self):
+        buf = array("L", [0] * 4)
+        ioctl(self._event_file, EVIOCGBIT(EV_FF, buf.itemsize * len(buf)), buf)
+        return sum(word << (i * buf.itemsize * 8) for i, word in enumerate(buf))
+
+    def _query_ff_effects(self):
+        buf = array("i", [0])
+        ioctl(self._event_file, EVIOCGEFFECTS, buf)
+        return buf[0]
+
+    def _probe_capabilities(self):
+        def query(probe, default):
+            try:
+                return probe()
+            except OSError:
+                # Not a joystick or evdev device, e.g. when testing
+                return default
+
+        ff_bits = query(self._query_ff_bits, 0)
+        return Capabilities(
+            name=query(self._query_name, ""),
+            driver_version=query(self._query_driver_version, ((0, 0, 0), (0, 0, 0))),
+            axis_map=query(self._query_axis_map, ()),
+            button_map=query(self._query_button_map, ()),
+            ff_bits=ff_bits,
+            ff_effects=query(self._query_ff_effects, 0),
+            has_rumble=bool((ff_bits >> FF_RUMBLE) & 1),
+            has_led=self._led_file is not None,
+        )
+
+    @property
+    def driver_version(self):
+        return self.capabilities.driver_version
+
+    @property
+    def axis_map(self):
+        return self.capabilities.axis_map
+
+    @property
+    def button_map(self):
+        return self.capabilities.button_map
+
     @property
     def num_axes(self):
         if self.raw_mode:
-            buf = array("B", [0] * 64)
-            ioctl(self._dev_file, JSIOCGAXES, buf)
-            return int(buf[0])
+            return len(self.capabilities.axis_map)
         else:
             return len(self.axes)
 
     @property
     def num_buttons(self):
         if self.raw_mode:
-            buf = array("B", [0])
-            ioctl(self._dev_file, JSIOCGBUTTONS, buf)
-            return int(buf[0])
+            return len(self.capabilities.button_map)
         else:
             return len(self.buttons)
 
     @property
     def name(self):
-        buf = array("B", [0] * 64)
-        ioctl(self._dev_file, JSIOCGNAME(len(buf)), buf)
-        return buf.tobytes().decode()
+        return self.capabilities.name
 
     def info(self):
         print("{0} at index {1}".format(self.name, self.index))
@@ -441,13 +1163,7 @@ class Xbox360Controller:
 
     @property
     def has_rumble(self):
-        buf = array("L", [0] * 4)
-        has_ff = EVIOCGBIT(EV_FF, struct.calcsize("L") * len(buf))
-        if ioctl(self._event_file, has_ff, buf) == -1:
-            return False
-        if (buf[1] >> FF_RUMBLE % (struct.calcsize("l") * 8)) & 1:
-            return True
-        return False
+        return self.capabilities.has_rumble
 
     def set_rumble(self, left, right, duration=1000):
         if not self.has_rumble:
@@ -462,51 +1178,85 @@ class Xbox360Controller:
         left_abs = int(left * 65535)
         right_abs = int(right * 65535)
 
-        stop = input_event(EV_FF, self._ff_id, 0)
-        if self._event_file.write(stop) == -1:
-            return False
-        self._event_file.flush()
-
-        effect = ff_effect(FF_RUMBLE, -1, duration, 0, left_abs, right_abs)
-        try:
-            buf = ioctl(self._event_file, EVIOCSFF, effect)
-        except OSError:
-            # Heavy usage yields a
-            # [Errno 28] No space left on device
-            # Simply reset and continue rumbling :)
-            self._ff_id = -1
-            self._event_file.close()
-            self._event_file = open(self._get_event_file(), "wb")
-            return self.set_rumble(left, right, duration)
-
-        self._ff_id = int.from_bytes(buf[1:3], "big")
-
-        play = input_event(EV_FF, self._ff_id, 1)
-        if self._event_file.write(play) == -1:
-            return False
-        self._event_file.flush()
+        if self.output is not None:
+            self.output.submit(RUMBLE, left_abs, right_abs, duration)
+        else:
+            self._write_rumble(left_abs, right_abs, duration)
 
         return True
 
+    def _write_rumble(self, left_abs, right_abs, duration):
+        # Updating the effect in place also restarts it if it's still playing
+        effect_id = self.effects.upload(0, FF_RUMBLE, duration, 0, left_abs, right_abs)
+        self.effects.play(effect_id)
+
+    def play_pattern(self, pattern, loop=False):
+        if not self.has_rumble:
+            raise RuntimeError("this device doesn't support rumbling")
+
+        if not isinstance(pattern, RumblePattern):
+            pattern = RumblePattern(pattern)
+        effects = pattern.effects()
+        # Slot 0 is kept for set_rumble()
+        max_effects = min(self.capabilities.ff_effects or MAX_EFFECTS, MAX_EFFECTS)
+        if len(effects) > max_effects - 1:
+            raise ValueError(
+                "pattern has more than {} steps rumbling".format(max_effects - 1)
+            )
+
+        self.stop_pattern()
+        effect_ids = [
+            self.effects.upload(slot, FF_RUMBLE, length, delay, strong, weak)
+            for slot, (delay, length, strong, weak) in enumerate(effects, 1)
+        ]
+        self._pattern = PatternPlayback(
+            self.effects, effect_ids, pattern.duration, loop
+        )
+        return self._pattern
+
+    def stop_pattern(self):
+        if self._pattern is not None:
+            self._pattern.cancel()
+            self._pattern = None
+
     @property
     def has_led(self):
-        return self._led_file is not None
+        return self.capabilities.has_led
 
     def set_led(self, status):
         if not self.has_led:
             raise RuntimeError("setting the LED status is not supported")
 
-        if 0 > status > 15:
+        if not 0 <= status <= 15:
             raise ValueError("status must be in range 0-15")
 
+        if self.output is not None:
+            self.output.submit(LED, status)
+        else:
+            self._write_led(status)
+
+    def _write_led(self, status):
         self._led_file.write(str(status))
         self._led_file.flush()
 
     def close(self):
-        self._dev_file.close()
-        self._event_file.close()
-        if self._led_file is not None:
-            self._led_file.close()
-
+        if self.output is not None:
+            # Sends what is still pending before the files are closed
+            self.output.close()
+        self._closed = True
         self._event_thread_stopped.set()
-        self._event_thread.join()
+        if self._reactor is not None:
+            self._reactor._unregister(self)
+
+        self.stop_pattern()
+        if self.connected:
+            self.effects.free()
+        # The thread is woken up and gone before its files are closed
+        self._stop_reading()
+        for thread in self._stopped_threads:
+            if thread is not current_thread():
+                thread.join()
+        self._stopped_threads = []
+        self._close_files()
+        self.connected = False
+        self._waker.close()
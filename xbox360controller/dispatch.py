@@ -0,0 +1,126 @@
+"""Running callbacks outside of the thread reading the device.
+
+A `Dispatcher` queues the callbacks triggered by incoming events and runs them
+on a pool of worker threads, so that slow callbacks can't hold up reading
+events from the device.
+"""
+
+import time
+import traceback
+from collections import deque
+from threading import Condition, Lock, Thread
+
+from xbox360controller.stats import Histogram
+
+# What to do with a new callback when the queue is full
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+
+POLICIES = (BLOCK, DROP_OLDEST, COALESCE)
+
+
+class Dispatcher:
+    def __init__(self, workers=1, maxsize=256, policy=BLOCK):
+        if policy not in POLICIES:
+            raise ValueError(
+                "policy must be one of {}".format(", ".join(map(repr, POLICIES)))
+            )
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        self.policy = policy
+        self.maxsize = maxsize
+        self.submitted = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.callback_duration = Histogram()
+
+        self._queue = deque()
+        self._pending = set()
+        self._lock = Lock()
+        self._not_empty = Condition(self._lock)
+        self._not_full = Condition(self._lock)
+        self._closed = False
+        self._workers = [Thread(target=self._work) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def submit(self, callback, target, call=None, coalesce=True):
+        # `call` runs the callback instead, e.g. timing it for the controller.
+        # Without `coalesce` the call is never skipped for one already queued,
+        # like the edges of a button, which each say something different.
+        with self._lock:
+            if self._closed:
+                return
+            self.submitted += 1
+
+            if self.policy == COALESCE and coalesce:
+                if target in self._pending:
+                    # The queued callback reads the latest state once it runs
+                    self.coalesced += 1
+                    return
+
+            while len(self._queue) >= self.maxsize:
+                if self.policy == BLOCK:
+                    self._not_full.wait()
+                    if self._closed:
+                        return
+                else:
+                    self._dequeue()
+                    self.dropped += 1
+
+            self._queue.append((callback, target, call, coalesce))
+            if coalesce:
+                self._pending.add(target)
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._not_empty.notify()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._closed:
+                    self._not_empty.wait()
+                if not self._queue:
+                    return
+                callback, target, call = self._dequeue()
+                self._not_full.notify()
+
+            start = time.perf_counter()
+            try:
+                if call is not None:
+                    call(callback, target)
+                else:
+                    callback(target)
+            except Exception:
+                self.errors += 1
+                traceback.print_exc()
+            self.callback_duration.add(time.perf_counter() - start)
+
+    def _dequeue(self):
+        callback, target, call, coalesce = self._queue.popleft()
+        if coalesce:
+            self._pending.discard(target)
+        return callback, target, call
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        for worker in self._workers:
+            worker.join()
@@ -0,0 +1,242 @@
+"""Reading input from the evdev interface (/dev/input/eventN).
+
+Compared to joydev, evdev has microsecond timestamps and groups the changes
+happening at the same time into frames terminated by a SYN_REPORT event. Each
+frame is applied to the controller state at once and runs a single pass of
+callbacks.
+"""
+
+import struct
+from array import array
+from fcntl import ioctl
+
+from xbox360controller.analog import table_shift
+from xbox360controller.controller import (
+    AXIS_NAMES,
+    BUTTON_NAMES,
+    ControllerEvent,
+    _invert_hat,
+    _rescale_trigger,
+)
+from xbox360controller.linux.input import EVIOCGABS, input_absinfo
+from xbox360controller.linux.input_event_codes import *
+
+# https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/input.h#L28-L46
+INPUT_EVENT_FORMAT = "2l2Hi"
+INPUT_EVENT_SIZE = struct.calcsize(INPUT_EVENT_FORMAT)
+
+# Ranges reported by xpad, used when the device can't be asked
+DEFAULT_ABS_RANGES = {
+    ABS_X: (-32768, 32767),
+    ABS_Y: (-32768, 32767),
+    ABS_Z: (0, 255),
+    ABS_RX: (-32768, 32767),
+    ABS_RY: (-32768, 32767),
+    ABS_RZ: (0, 255),
+    ABS_HAT0X: (-1, 1),
+    ABS_HAT0Y: (-1, 1),
+}
+
+# Button codes in the order of Xbox360Controller.buttons
+BUTTON_CODES = [
+    BTN_A,
+    BTN_B,
+    BTN_X,
+    BTN_Y,
+    BTN_TL,
+    BTN_TR,
+    BTN_SELECT,
+    BTN_START,
+    BTN_MODE,
+    BTN_THUMBL,
+    BTN_THUMBR,
+]
+
+
+class EvdevInput:
+    def __init__(self, controller, file, abs_ranges=None):
+        self.file = file
+        self._controller = controller
+        # Ranges of the axes by code, when the device itself can't be asked
+        self._abs_ranges = abs_ranges
+        self._values = controller._values
+        self._abs = self._build_abs_table()
+        self._keys = self._build_key_table()
+        self._frame = []
+        self._dropped = False
+        controller._state.publish()
+
+    def _get_abs_info(self, code):
+        if self._abs_ranges is not None:
+            minimum, maximum = self._abs_ranges.get(
+                code, DEFAULT_ABS_RANGES.get(code, (-32768, 32767))
+            )
+            return 0, minimum, maximum
+        buf = array("i", [0] * 6)
+        try:
+            ioctl(self.file, EVIOCGABS(code), buf)
+        except OSError:
+            minimum, maximum = DEFAULT_ABS_RANGES.get(code, (-32768, 32767))
+            return 0, minimum, maximum
+        return input_absinfo(buf.tobytes())
+
+    def _build_abs_table(self):
+        # Maps an absolute axis code to (axis, state index, table, callback
+        # table, radial deadzone, minimum, maximum, table shift)
+        controller = self._controller
+        if controller.raw_mode:
+            codes = {name.lower(): code for code, name in AXIS_NAMES.items()}
+            entries = [
+                (codes[axis.name], axis, axis._index, None) for axis in controller.axes
+            ]
+        else:
+            axis_l, axis_r, hat = controller.axis_l, controller.axis_r, controller.hat
+            trigger_l, trigger_r = controller.trigger_l, controller.trigger_r
+            # Same transformations as for the joydev axis numbers
+            entries = [
+                (ABS_X, axis_l, axis_l._index, None),
+                (ABS_Y, axis_l, axis_l._index + 1, None),
+                (ABS_Z, trigger_l, trigger_l._index, _rescale_trigger),
+                (ABS_RX, axis_r, axis_r._index, None),
+                (ABS_RY, axis_r, axis_r._index + 1, None),
+                (ABS_RZ, trigger_r, trigger_r._index, _rescale_trigger),
+                (ABS_HAT0X, hat, hat._index, int),
+                (ABS_HAT0Y, hat, hat._index + 1, _invert_hat),
+            ]
+
+        table = {}
+        for code, axis, index, transform in entries:
+            value, minimum, maximum = self._get_abs_info(code)
+            if minimum == -maximum or minimum == -maximum - 1:
+                # Symmetric around 0, scale so that 0 stays 0
+                offset, scale = 0, 1 / maximum
+            else:
+                offset = (minimum + maximum) / 2
+                scale = 2 / (maximum - minimum)
+            size = maximum - minimum + 1
+            tables = controller._lookup_tables(
+                axis, index, transform, minimum, size, offset, scale, True
+            )
+            table[code] = (axis, index, *tables, minimum, maximum, table_shift(size))
+
+            # evdev doesn't send the initial state like joydev does
+            self._set_abs(table[code], value)
+        return table
+
+    def rebuild(self):
+        # After the axes were configured, replaced at once for the thread
+        # reading the device
+        self._abs = self._build_abs_table()
+
+    def _set_abs(self, entry, value):
+        # Returns the value compared to the axis threshold
+        axis, index, table, callback_table, radial, minimum, maximum, shift = entry
+        if value < minimum:
+            value = minimum
+        elif value > maximum:
+            value = maximum
+        value = (value - minimum) >> shift
+        if radial is not None:
+            return radial.update(index, table[value], self._values)
+        self._values[index] = table[value]
+        return callback_table[value]
+
+    def _build_key_table(self):
+        # Maps a key code to (hat state index, hat sign, button)
+        controller = self._controller
+        if controller.raw_mode:
+            codes = {name.lower(): code for code, name in BUTTON_NAMES.items()}
+            return {
+                codes[button.name]: (None, 0, button) for button in controller.buttons
+            }
+
+        table = {
+            code: (None, 0, button)
+            for code, button in zip(BUTTON_CODES, controller.buttons)
+        }
+        # Some controllers report the hat as buttons, these are the same as
+        # joydev's button numbers 11-14
+        for code, number in zip(
+            (
+                BTN_TRIGGER_HAPPY1,
+                BTN_TRIGGER_HAPPY2,
+                BTN_TRIGGER_HAPPY3,
+                BTN_TRIGGER_HAPPY4,
+            ),
+            range(11, 15),
+        ):
+            table[code] = controller._button_table[number]
+        return table
+
+    def decode(self, view):
+        return [
+            ControllerEvent(
+                time=sec + usec / 1000000,
+                type=type_,
+                number=code,
+                value=value,
+                is_init=False,
+            )
+            for sec, usec, type_, code, value in struct.iter_unpack(
+                INPUT_EVENT_FORMAT, view
+            )
+        ]
+
+    def process(self, events):
+        for event in events:
+            if event.type != EV_SYN:
+                if not self._dropped:
+                    self._frame.append(event)
+            elif event.number == SYN_REPORT:
+                if not self._dropped:
+                    self._apply(self._frame, event.time)
+                self._dropped = False
+                self._frame.clear()
+            elif event.number == SYN_DROPPED:
+                # The kernel buffer overflowed, throw away everything up to
+                # and including the next SYN_REPORT
+                self._dropped = True
+                self._frame.clear()
+                if self._controller._stats is not None:
+                    self._controller._stats.drops += 1
+
+    def _apply(self, frame, time):
+        controller = self._controller
+        values = self._values
+        moved = {}
+        hat = []
+        buttons = []
+
+        for event in frame:
+            if event.type == EV_ABS:
+                try:
+                    entry = self._abs[event.number]
+                except KeyError:
+                    continue
+                val = abs(self._set_abs(entry, event.value))
+                axis = entry[0]
+                moved[axis] = max(moved.get(axis, 0.0), val)
+
+            elif event.type == EV_KEY and event.value != 2:
+                try:
+                    hat_index, hat_sign, button = self._keys[event.number]
+                except KeyError:
+                    continue
+                if hat_index is not None:
+                    val = hat_sign * event.value
+                    values[hat_index] = val
+                    hat.append(val)
+                if button is not None:
+                    values[button._index] = event.value
+                    buttons.append((button, event.value))
+
+        controller._state.time = time
+        controller._state.publish()
+
+        for axis, val in moved.items():
+            controller.axis_callback(axis, val)
+        for val in hat:
+            # Button edges are never coalesced
+            controller.axis_callback(controller.hat, val, coalesce=False)
+        for button, value in buttons:
+            controller._button_callback(button, value)
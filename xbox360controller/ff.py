@@ -0,0 +1,207 @@
+"""Keeping force-feedback effects uploaded to the device.
+
+The kernel only has room for a handful of effects per device. Rather than
+uploading a new effect for every `set_rumble` call, an `EffectPool` holds on to
+a few effect ids and updates them in place, so that frequent updates cost the
+same two syscalls each and never run out of space.
+"""
+
+import errno
+from fcntl import ioctl
+from struct import unpack_from
+from threading import Event, Thread, current_thread
+from time import monotonic
+
+from xbox360controller.linux.input import (
+    EVIOCRMFF,
+    EVIOCSFF,
+    ff_effect,
+    input_event,
+)
+from xbox360controller.linux.input_event_codes import EV_FF
+
+# ff-memless, which xpad uses, has room for this many effects per device
+MAX_EFFECTS = 16
+
+
+class EffectPool:
+    def __init__(self, file=None, size=1):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+
+        self.size = size
+        # Effects uploaded with a new id, updated in place and played again
+        # without touching the device
+        self.uploads = 0
+        self.updates = 0
+        self.reuses = 0
+
+        self._ids = [-1] * size
+        self._effects = [None] * size
+        # The PatternPlayback playing effects of the pool, if any
+        self.playback = None
+        self.reset(file)
+
+    def reset(self, file):
+        # Effects belong to the file they were uploaded with, e.g. after
+        # reconnecting all slots have to be uploaded again
+        self.file = file
+        self._ids = [-1] * self.size
+        self._effects = [None] * self.size
+
+    @property
+    def ids(self):
+        return tuple(self._ids)
+
+    def upload(self, slot, type_, length, delay, strong, weak):
+        effect_id = self._ids[slot]
+        effect = (type_, length, delay, strong, weak)
+        if effect_id != -1 and self._effects[slot] == effect:
+            self.reuses += 1
+            return effect_id
+
+        try:
+            effect_id = self._upload(effect_id, effect)
+        except OSError as e:
+            if e.errno != errno.ENOSPC:
+                raise
+            # Heavy usage (or another program sharing the device) used up
+            # the effect memory, start over once with an empty pool, without
+            # a pattern playing effects that are gone
+            self.free()
+            effect_id = self._upload(-1, effect)
+
+        self._ids[slot] = effect_id
+        self._effects[slot] = effect
+        return effect_id
+
+    def _upload(self, effect_id, effect):
+        type_, length, delay, strong, weak = effect
+        buf = ioctl(
+            self.file,
+            EVIOCSFF,
+            ff_effect(type_, effect_id, length, delay, strong, weak),
+        )
+        if effect_id == -1:
+            self.uploads += 1
+        else:
+            self.updates += 1
+        return unpack_from("h", buf, 2)[0]
+
+    def play(self, *effect_ids, count=1):
+        # A single write for any number of effects
+        if not effect_ids:
+            return
+        self.file.write(
+            b"".join(input_event(EV_FF, effect_id, count) for effect_id in effect_ids)
+        )
+
+    def stop(self, *effect_ids):
+        self.play(*effect_ids, count=0)
+
+    def free(self):
+        if self.playback is not None:
+            self.playback.cancel()
+            self.playback = None
+        for slot, effect_id in enumerate(self._ids):
+            if effect_id == -1:
+                continue
+            self._ids[slot] = -1
+            self._effects[slot] = None
+            try:
+                ioctl(self.file, EVIOCRMFF, effect_id)
+            except OSError:
+                # The device is gone, and so are its effects
+                pass
+
+
+class RumblePattern:
+    """A sequence of ``(left, right, duration)`` steps to rumble.
+
+    Strengths are in range 0-1 and durations in milliseconds, a step with both
+    strengths 0 is a pause.
+    """
+
+    def __init__(self, steps):
+        self.steps = tuple(steps)
+        if not self.steps:
+            raise ValueError("a pattern needs at least one step")
+        for left, right, duration in self.steps:
+            if not (1 >= left >= 0 and 1 >= right >= 0):
+                raise ValueError("left and right must be in range 0-1")
+            if duration <= 0:
+                raise ValueError("duration must be greater than 0")
+        self.duration = sum(duration for _, _, duration in self.steps)
+
+    @classmethod
+    def pulse(cls, strength=1.0, on=100, off=100, count=1):
+        return cls([(strength, strength, on), (0, 0, off)] * count)
+
+    @classmethod
+    def ramp(cls, start, end, duration, steps=8):
+        pattern = []
+        for i in range(steps):
+            strength = start + (end - start) * i / max(steps - 1, 1)
+            length = round(duration * (i + 1) / steps) - round(duration * i / steps)
+            pattern.append((strength, strength, length))
+        return cls(pattern)
+
+    def effects(self):
+        """Return ``(delay, length, strong, weak)`` of every effect to upload."""
+        effects = []
+        delay = 0
+        for left, right, duration in self.steps:
+            if left or right:
+                effects.append((delay, duration, int(left * 65535), int(right * 65535)))
+            delay += duration
+        return effects
+
+
+class PatternPlayback:
+    # Plays the effects of a pattern all at once, the kernel starts each one
+    # after its replay delay. Looping replays them once per cycle.
+    def __init__(self, pool, effect_ids, duration, loop=False):
+        self.pool = pool
+        self.effect_ids = effect_ids
+        self.duration = duration
+        self.loop = loop
+        self._stopped = Event()
+        self._thread = None
+        self._start = monotonic()
+        pool.playback = self
+        pool.play(*effect_ids)
+        if loop:
+            self._thread = Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    @property
+    def playing(self):
+        if self._stopped.is_set():
+            return False
+        return self.loop or monotonic() - self._start < self.duration / 1000
+
+    def _loop(self):
+        # Scheduled from the start, so that the cycles don't drift apart
+        cycle = 1
+        while True:
+            next_cycle = self._start + cycle * self.duration / 1000
+            if self._stopped.wait(next_cycle - monotonic()):
+                return
+            try:
+                self.pool.play(*self.effect_ids)
+            except (OSError, ValueError):
+                # The device is gone, or the controller was closed
+                self._stopped.set()
+                return
+            cycle += 1
+
+    def cancel(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._thread is not None and self._thread is not current_thread():
+            self._thread.join()
+        try:
+            self.pool.stop(*self.effect_ids)
+        except (OSError, ValueError):
+            pass
@@ -0,0 +1,211 @@
+"""Keeping the latest input events of a controller.
+
+An `EventHistory` stores the events in a ring buffer of parallel arrays, one
+each for the times, types, numbers and values, allocated once up front: no
+object is created per event and the memory used never grows. Events are
+stored in the order they were read, so time ranges are found by binary
+search over the times.
+"""
+
+import struct
+from array import array
+from collections import namedtuple
+from threading import Lock
+
+from xbox360controller.controller import BOOT_TIME, JS_EVENT_FORMAT, ControllerEvent
+from xbox360controller.evdev import INPUT_EVENT_FORMAT
+from xbox360controller.linux.joystick import JS_EVENT_INIT
+from xbox360controller.record import pack_header
+
+HistorySlice = namedtuple("HistorySlice", ["times", "types", "numbers", "values"])
+
+
+class EventHistory:
+    def __init__(self, controller, capacity=4096):
+        if capacity <= 0:
+            raise ValueError("capacity must be greater than 0")
+
+        self.controller = controller
+        self.capacity = capacity
+        # Number of events ever stored, the oldest one kept is at
+        # written % capacity once the buffer is full
+        self.written = 0
+        self._evdev = controller._evdev is not None
+        self.times = array("d", bytes(8 * capacity))
+        self.types = array("H", bytes(2 * capacity))
+        self.numbers = array("H", bytes(2 * capacity))
+        self.values = array("i", bytes(4 * capacity))
+        self._lock = Lock()
+        controller._taps += (self,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def write(self, data):
+        # Called with every read by the thread reading the device
+        times = self.times
+        types = self.types
+        numbers = self.numbers
+        values = self.values
+        capacity = self.capacity
+        with self._lock:
+            position = self.written % capacity
+            if self._evdev:
+                for sec, usec, type_, code, value in struct.iter_unpack(
+                    INPUT_EVENT_FORMAT, data
+                ):
+                    times[position] = sec + usec / 1000000
+                    types[position] = type_
+                    numbers[position] = code
+                    values[position] = value
+                    position = position + 1 if position + 1 < capacity else 0
+            else:
+                for time_, value, type_, number in struct.iter_unpack(
+                    JS_EVENT_FORMAT, data
+                ):
+                    times[position] = round(BOOT_TIME + (time_ / 1000), 4)
+                    types[position] = type_
+                    numbers[position] = number
+                    values[position] = value
+                    position = position + 1 if position + 1 < capacity else 0
+            self.written += len(data) // self.controller._record_size
+
+    def _first(self):
+        # Position of the oldest event kept
+        return self.written % self.capacity if self.written > self.capacity else 0
+
+    def _bisect(self, first, length, time):
+        # Number of the kept events older than `time`
+        times = self.times
+        capacity = self.capacity
+        low, high = 0, length
+        while low < high:
+            middle = (low + high) // 2
+            if times[(first + middle) % capacity] < time:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _bounds(self, start, end):
+        # Offsets from the oldest event kept of the events from `start` up
+        # to, not including, `end`
+        first = self._first()
+        length = len(self)
+        low = 0 if start is None else self._bisect(first, length, start)
+        high = length if end is None else self._bisect(first, length, end)
+        return first, low, high
+
+    def _range(self, start, end):
+        # Positions of the events from `start` up to, not including, `end`
+        first, low, high = self._bounds(start, end)
+        return [(first + i) % self.capacity for i in range(low, high)]
+
+    def _keys(self, controls):
+        if controls is None:
+            return None
+        names = {
+            control if isinstance(control, str) else control.name
+            for control in controls
+        }
+        return self.controller._event_keys(names)
+
+    def _positions(self, start, end, controls):
+        positions = self._range(start, end)
+        keys = self._keys(controls)
+        if keys is None:
+            return positions
+        types = self.types
+        numbers = self.numbers
+        return [
+            position
+            for position in positions
+            if (types[position] & ~JS_EVENT_INIT, numbers[position]) in keys
+        ]
+
+    def count(self, start=None, end=None, controls=None):
+        """Return the number of events from `start` up to `end` of the given
+        axes and buttons, or of all of them."""
+        with self._lock:
+            if controls is None:
+                # Found by the binary searches alone
+                _, low, high = self._bounds(start, end)
+                return high - low
+            return len(self._positions(start, end, controls))
+
+    def events(self, start=None, end=None, controls=None):
+        """Return the events from `start` up to `end` of the given axes and
+        buttons, or of all of them, as `ControllerEvent` objects."""
+        with self._lock:
+            return [
+                ControllerEvent(
+                    time=self.times[position],
+                    type=self.types[position],
+                    number=self.numbers[position],
+                    value=self.values[position],
+                    is_init=not self._evdev
+                    and bool(self.types[position] & JS_EVENT_INIT),
+                )
+                for position in self._positions(start, end, controls)
+            ]
+
+    def slice(self, start=None, end=None, controls=None):
+        """Return the events from `start` up to `end` as a `HistorySlice` of
+        arrays, each can be turned into bytes or a memoryview."""
+        with self._lock:
+            positions = self._positions(start, end, controls)
+            return HistorySlice(
+                *(
+                    array(column.typecode, [column[p] for p in positions])
+                    for column in (self.times, self.types, self.numbers, self.values)
+                )
+            )
+
+    def to_bytes(self, start=None, end=None, controls=None):
+        """Return the events from `start` up to `end` in the format of the
+        device, like a `Recorder` writes them."""
+        times, types, numbers, values = self.slice(start, end, controls)
+        if self._evdev:
+            records = []
+            for time_, type_, code, value in zip(times, types, numbers, values):
+                sec = int(time_)
+                usec = round((time_ - sec) * 1000000)
+                if usec == 1000000:
+                    sec, usec = sec + 1, 0
+                records.append(
+                    struct.pack(INPUT_EVENT_FORMAT, sec, usec, type_, code, value)
+                )
+            return b"".join(records)
+        return b"".join(
+            struct.pack(
+                JS_EVENT_FORMAT,
+                round((time_ - BOOT_TIME) * 1000) & 0xFFFFFFFF,
+                value,
+                type_,
+                number,
+            )
+            for time_, type_, number, value in zip(times, types, numbers, values)
+        )
+
+    def save(self, path, start=None, end=None, controls=None):
+        """Write the events from `start` up to `end` to a recording that a
+        `Replayer` can play."""
+        data = self.to_bytes(start, end, controls)
+        with open(path, "wb") as f:
+            f.write(pack_header(self.controller))
+            f.write(data)
+
+    def clear(self):
+        with self._lock:
+            self.written = 0
+
+    def close(self):
+        self.controller._taps = tuple(
+            tap for tap in self.controller._taps if tap is not self
+        )
@@ -0,0 +1,208 @@
+"""Finding controllers, and noticing when they are plugged in or out.
+
+Controllers are enumerated from sysfs without opening their devices. The
+`HotplugWatcher` uses inotify on /dev/input to report joystick devices coming
+and going, and can reconnect existing `Xbox360Controller` instances.
+"""
+
+import os
+import re
+import select
+import traceback
+from collections import namedtuple
+from functools import partial
+from glob import glob
+from threading import Event, Lock, Thread
+
+from xbox360controller.linux.inotify import *
+from xbox360controller.wakeup import Waker
+
+SYSFS_INPUT = "/sys/class/input"
+DEV_INPUT = "/dev/input"
+
+JS_NAME = re.compile(r"^js(\d+)$")
+EVENT_NAME = re.compile(r"^event\d+$")
+
+ControllerInfo = namedtuple(
+    "ControllerInfo",
+    ["index", "name", "vendor", "product", "device", "event_device", "led_file"],
+)
+
+
+def _read_sysfs(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _read_sysfs_hex(path):
+    value = _read_sysfs(path)
+    return int(value, 16) if value else None
+
+
+def get_controller_info(index, sysfs=SYSFS_INPUT, dev=DEV_INPUT):
+    base = os.path.join(sysfs, "js{idx}".format(idx=index), "device")
+    events = sorted(glob(os.path.join(base, "event*")))
+    led_file = "/sys/class/leds/xpad{idx}/brightness".format(idx=index)
+    return ControllerInfo(
+        index=index,
+        name=_read_sysfs(os.path.join(base, "name")),
+        vendor=_read_sysfs_hex(os.path.join(base, "id", "vendor")),
+        product=_read_sysfs_hex(os.path.join(base, "id", "product")),
+        device=os.path.join(dev, "js{idx}".format(idx=index)),
+        event_device=(
+            os.path.join(dev, os.path.basename(events[0])) if events else None
+        ),
+        led_file=led_file if os.path.exists(led_file) else None,
+    )
+
+
+def _get_indexes(directory):
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(int(match.group(1)) for match in map(JS_NAME.match, names) if match)
+
+
+def enumerate_controllers(sysfs=SYSFS_INPUT, dev=DEV_INPUT):
+    return [get_controller_info(index, sysfs, dev) for index in _get_indexes(sysfs)]
+
+
+class HotplugWatcher:
+    def __init__(
+        self, on_connect=None, on_disconnect=None, dev=DEV_INPUT, timeout=None
+    ):
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.timeout = timeout
+        self._dev = dev
+        self._controllers = {}
+        self._lock = Lock()
+        self._connected = set(_get_indexes(dev))
+        # Indexes whose controllers failed to reconnect, tried again on the
+        # next event of any input device
+        self._pending = set()
+
+        self._fd = inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        inotify_add_watch(
+            self._fd,
+            dev,
+            IN_CREATE | IN_DELETE | IN_ATTRIB | IN_MOVED_TO | IN_MOVED_FROM,
+        )
+
+        self._stopped = Event()
+        self._waker = Waker()
+        self._thread = Thread(target=self._loop)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def connected(self):
+        return sorted(self._connected)
+
+    def attach(self, controller):
+        with self._lock:
+            self._controllers.setdefault(controller.index, []).append(controller)
+
+    def detach(self, controller):
+        with self._lock:
+            self._controllers.get(controller.index, []).remove(controller)
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            try:
+                r, w, e = select.select([self._fd, self._waker], [], [], self.timeout)
+                if self._waker in r:
+                    self._waker.clear()
+                if self._fd not in r:
+                    continue
+                buf = os.read(self._fd, 4096)
+            except BlockingIOError:
+                continue
+            except (OSError, ValueError):
+                # inotify file descriptor closed in main thread
+                return
+
+            for mask, name in inotify_events(buf):
+                match = JS_NAME.match(name)
+                removed = mask & (IN_DELETE | IN_MOVED_FROM)
+                if match is not None:
+                    if removed:
+                        self._handle_disconnect(int(match.group(1)))
+                    else:
+                        self._handle_connect(int(match.group(1)))
+                elif EVENT_NAME.match(name) and not removed:
+                    # E.g. the event device of a joystick showing up or
+                    # becoming readable after it
+                    for index in sorted(self._pending):
+                        self._handle_connect(index)
+
+    def _handle_connect(self, index):
+        if index in self._connected:
+            return
+        name = "js{idx}".format(idx=index)
+        if not os.access(os.path.join(self._dev, name), os.R_OK):
+            # Wait for udev to update the permissions, which is an IN_ATTRIB
+            return
+
+        with self._lock:
+            controllers = list(self._controllers.get(index, []))
+            # Taken back by _reconnect(), which might run later on the
+            # controller's event loop
+            self._connected.add(index)
+            self._pending.discard(index)
+        for controller in controllers:
+            if controller._closed:
+                continue
+            try:
+                controller._run_on_reader(partial(self._reconnect, controller))
+            except Exception:
+                traceback.print_exc()
+                return
+
+        if self.on_connect is not None and callable(self.on_connect):
+            self.on_connect(index)
+
+    def _reconnect(self, controller):
+        try:
+            controller.reconnect()
+        except Exception:
+            # Still not connected, the next event of the device, e.g. the
+            # event device becoming readable, tries again
+            with self._lock:
+                self._connected.discard(controller.index)
+                self._pending.add(controller.index)
+            raise
+
+    def _handle_disconnect(self, index):
+        with self._lock:
+            self._pending.discard(index)
+        if index not in self._connected:
+            return
+        self._connected.discard(index)
+
+        with self._lock:
+            controllers = list(self._controllers.get(index, []))
+        for controller in controllers:
+            try:
+                controller._run_on_reader(controller._disconnected)
+            except Exception:
+                traceback.print_exc()
+
+        if self.on_disconnect is not None and callable(self.on_disconnect):
+            self.on_disconnect(index)
+
+    def close(self):
+        self._stopped.set()
+        self._waker.wake()
+        self._thread.join()
+        os.close(self._fd)
+        self._waker.close()
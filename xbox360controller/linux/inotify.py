@@ -0,0 +1,47 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+
+# https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/inotify.h#L18-L32
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+# https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/inotify.h#L82-L83
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+# https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/inotify.h#L16-L22
+INOTIFY_EVENT_FORMAT = "iIII"
+INOTIFY_EVENT_SIZE = struct.calcsize(INOTIFY_EVENT_FORMAT)
+
+_libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+
+
+def _check(result):
+    if result == -1:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    return result
+
+
+def inotify_init1(flags):
+    return _check(_libc.inotify_init1(flags))
+
+
+def inotify_add_watch(fd, path, mask):
+    return _check(_libc.inotify_add_watch(fd, path.encode(), mask))
+
+
+def inotify_events(buf):
+    # Yields (mask, name) for each struct inotify_event in buf
+    offset = 0
+    while offset + INOTIFY_EVENT_SIZE <= len(buf):
+        wd, mask, cookie, length = struct.unpack_from(INOTIFY_EVENT_FORMAT, buf, offset)
+        offset += INOTIFY_EVENT_SIZE
+        name = bytes(buf[offset : offset + length]).rstrip(b"\0").decode()
+        offset += length
+        yield mask, name
@@ -1,5 +1,5 @@
-from struct import pack
-from ctypes import c_buffer, c_uint32
+from struct import pack, unpack
+from ctypes import c_buffer, c_int32, c_uint32
 from xbox360controller.linux.ioctl import _IOR, _IOC_READ, _IOC, _IOW
 
 
@@ -12,6 +12,17 @@ def input_event(type_, code, value, tv_sec=0, tv_usec=0):
 EVIOCGVERSION = _IOR("E", 0x01, c_uint32)
 
 
+# https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/input.h#L68-L75
+def input_absinfo(buf):
+    value, minimum, maximum, fuzz, flat, resolution = unpack("6i", buf)
+    return value, minimum, maximum
+
+
+# https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/input.h#L146
+def EVIOCGABS(abs_):
+    return _IOR("E", 0x40 + abs_, c_int32 * 6)
+
+
 # https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/input.h#L174
 def EVIOCGBIT(ev, len_):
     return _IOC(_IOC_READ, "E", 0x20 + ev, len_)
@@ -20,6 +31,12 @@ def EVIOCGBIT(ev, len_):
 # https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/input.h#L178
 EVIOCSFF = _IOW("E", 0x80, c_buffer(b"0" * 47))  # 48
 
+# https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/input.h#L179
+EVIOCRMFF = _IOW("E", 0x81, c_int32)
+
+# https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/input.h#L181
+EVIOCGEFFECTS = _IOR("E", 0x84, c_int32)
+
 
 # https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/input.h#L426-L463
 def ff_effect(
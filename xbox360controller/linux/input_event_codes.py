@@ -1,6 +1,13 @@
-# https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/input-event-codes.h#L47
+# https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/input-event-codes.h#L38-L47
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_ABS = 0x03
 EV_FF = 0x15
 
+# https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/input-event-codes.h#L53-L56
+SYN_REPORT = 0
+SYN_DROPPED = 3
+
 # https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/input-event-codes.h#L342
 BTN_MISC = 0x100
 
@@ -39,6 +46,12 @@ BTN_MODE = 0x13C
 BTN_THUMBL = 0x13D
 BTN_THUMBR = 0x13E
 
+# https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/input-event-codes.h#L702-L705
+BTN_TRIGGER_HAPPY1 = 0x2C0
+BTN_TRIGGER_HAPPY2 = 0x2C1
+BTN_TRIGGER_HAPPY3 = 0x2C2
+BTN_TRIGGER_HAPPY4 = 0x2C3
+
 # https://github.com/torvalds/linux/blob/141e5dcaa7356077028b4cd48ec351a38c70e5e5/include/uapi/linux/input-event-codes.h#L722-L753
 ABS_X = 0x00
 ABS_Y = 0x01
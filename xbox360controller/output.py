@@ -0,0 +1,96 @@
+"""Writing rumble and LED commands from a background thread.
+
+An `OutputWriter` keeps only the latest requested state of every output and
+sends it to the device from its own thread, at most `rate` times a second, so
+that calling `set_rumble()` or `set_led()` never waits on the device.
+"""
+
+import time
+import traceback
+from threading import Condition, Lock, Thread
+
+RUMBLE = "rumble"
+LED = "led"
+
+# LED statuses that stay as they are, writing them again wouldn't change
+# anything on the device. Blinking and rotating start over like rumbling
+# again restarts the effect, so these are never skipped.
+STEADY_LED = frozenset((0, 6, 7, 8, 9))
+
+
+class OutputWriter:
+    def __init__(self, controller, rate=100):
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+
+        self.rate = rate
+        self.submitted = 0
+        self.merged = 0
+        self.skipped = 0
+        self.written = 0
+        self.errors = 0
+
+        self._writers = {RUMBLE: controller._write_rumble, LED: controller._write_led}
+        self._pending = {}
+        self._written = {}
+        self._next_write = 0
+        self._lock = Lock()
+        self._changed = Condition(self._lock)
+        self._closed = False
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, output, *args):
+        with self._lock:
+            if self._closed:
+                return
+            self.submitted += 1
+            if output in self._pending:
+                self.merged += 1
+            self._pending[output] = args
+            self._changed.notify()
+
+    def reset(self):
+        # The device forgot what was written to it, e.g. after reconnecting
+        with self._lock:
+            self._written.clear()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._changed.wait()
+                # Flush what is pending even when closing
+                while not self._closed:
+                    delay = self._next_write - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._changed.wait(delay)
+                if not self._pending:
+                    return
+                pending = self._pending
+                self._pending = {}
+
+            for output, args in pending.items():
+                if (
+                    output == LED
+                    and args[0] in STEADY_LED
+                    and self._written.get(output) == args
+                ):
+                    self.skipped += 1
+                    continue
+                try:
+                    self._writers[output](*args)
+                except Exception:
+                    self.errors += 1
+                    traceback.print_exc()
+                    continue
+                self._written[output] = args
+                self.written += 1
+            self._next_write = time.monotonic() + 1 / self.rate
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._changed.notify_all()
+        self._thread.join()
@@ -0,0 +1,115 @@
+"""A shared epoll based event loop for multiple controllers.
+
+Instead of one reader thread per controller, a single thread waits for input
+on the device files of all registered controllers and dispatches their events.
+"""
+
+import select
+from threading import Event, RLock, Thread
+
+from xbox360controller.wakeup import Waker
+
+
+class Reactor:
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.wakeups = 0
+        self._epoll = select.epoll()
+        self._waker = Waker()
+        self._epoll.register(self._waker.fileno(), select.EPOLLIN)
+        self._controllers = {}
+        self._lock = RLock()
+        self._stopped = Event()
+        self._thread = Thread(target=self._loop)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._controllers)
+
+    @property
+    def controllers(self):
+        return list(self._controllers.values())
+
+    def add(self, controller):
+        if controller._reactor is self:
+            return
+        controller._stop_reading()
+        controller._reactor = self
+        controller._start_reading()
+
+    def remove(self, controller):
+        if controller._reactor is not self:
+            raise ValueError("controller is not serviced by this reactor")
+        controller._stop_reading()
+        controller._reactor = None
+        controller._start_reading()
+
+    def _register(self, controller):
+        fd = controller._input_file.fileno()
+        with self._lock:
+            self._controllers[fd] = controller
+            self._epoll.register(fd, select.EPOLLIN)
+
+    def _unregister(self, controller):
+        with self._lock:
+            for fd, registered in list(self._controllers.items()):
+                if registered is controller:
+                    del self._controllers[fd]
+                    self._epoll.unregister(fd)
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            timeout = self.timeout
+            for controller in self.controllers:
+                flush_timeout = controller._flush_timeout()
+                if flush_timeout is not None and (
+                    timeout is None or flush_timeout < timeout
+                ):
+                    timeout = flush_timeout
+            try:
+                ready = self._epoll.poll(timeout)
+            except (OSError, ValueError):
+                # epoll closed in main thread
+                return
+            self.wakeups += 1
+            for fd, mask in ready:
+                if fd == self._waker.fileno():
+                    self._waker.clear()
+                    continue
+                with self._lock:
+                    controller = self._controllers.get(fd)
+                if controller is None:
+                    continue
+                try:
+                    size = controller._read()
+                except ValueError:
+                    # Device file closed in another thread
+                    continue
+                except OSError:
+                    # Device unplugged or unreadable, stop polling it
+                    controller._disconnected()
+                    continue
+                # Callbacks run without holding the lock, so that add() and
+                # remove() don't wait for them, and their errors aren't taken
+                # for read errors
+                controller._process_read(size)
+            for controller in self.controllers:
+                if controller._coalesced_axes:
+                    controller._flush_coalesced()
+
+    def close(self):
+        self._stopped.set()
+        self._waker.wake()
+        self._thread.join()
+        with self._lock:
+            for controller in self.controllers:
+                controller._reactor = None
+            self._controllers.clear()
+            self._epoll.close()
+        self._waker.close()
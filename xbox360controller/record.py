@@ -0,0 +1,221 @@
+"""Recording and replaying the raw input events of a controller.
+
+A recording starts with a small header describing the controller, including
+the ranges of the evdev axes, followed by the input events exactly as they were read from the device. Replaying feeds
+them to `Xbox360Controller.process_events`, so callbacks, thresholds and rate
+limits behave like they did live.
+"""
+
+import mmap
+import struct
+import time
+from collections import namedtuple
+
+from xbox360controller.controller import EVDEV, JOYDEV, READ_BATCH_SIZE
+
+MAGIC = b"X360REC\0"
+VERSION = 2
+
+# magic, version, backend, raw mode, record size, name length, number of axes,
+# number of buttons, number of evdev axis ranges
+HEADER_FORMAT = "<8sBBBBBBHB"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# code, minimum and maximum of an evdev axis
+ABS_RANGE_FORMAT = "<Hii"
+ABS_RANGE_SIZE = struct.calcsize(ABS_RANGE_FORMAT)
+
+BACKENDS = (JOYDEV, EVDEV)
+
+
+Header = namedtuple(
+    "Header",
+    [
+        "backend",
+        "raw_mode",
+        "record_size",
+        "name",
+        "axis_map",
+        "button_map",
+        "abs_ranges",
+    ],
+)
+
+
+def pack_header(controller):
+    """Return the header describing the events `controller` reads."""
+    name = controller.name.encode()
+    axis_map = controller.axis_map
+    button_map = controller.button_map
+    # The device can't be asked for them through a socket or a recording
+    abs_ranges = []
+    if controller._evdev is not None:
+        abs_ranges = [
+            (code, entry[5], entry[6]) for code, entry in controller._evdev._abs.items()
+        ]
+    return (
+        struct.pack(
+            HEADER_FORMAT,
+            MAGIC,
+            VERSION,
+            BACKENDS.index(controller.backend),
+            controller.raw_mode,
+            controller._record_size,
+            len(name),
+            len(axis_map),
+            len(button_map),
+            len(abs_ranges),
+        )
+        + name
+        + struct.pack("<{}B".format(len(axis_map)), *axis_map)
+        + struct.pack("<{}H".format(len(button_map)), *button_map)
+        + b"".join(struct.pack(ABS_RANGE_FORMAT, *entry) for entry in abs_ranges)
+    )
+
+
+def unpack_header(buf):
+    """Return the `Header` at the start of `buf` and its size."""
+    try:
+        (
+            magic,
+            version,
+            backend,
+            raw_mode,
+            record_size,
+            name_length,
+            num_axes,
+            num_buttons,
+            num_abs_ranges,
+        ) = struct.unpack_from(HEADER_FORMAT, buf)
+    except struct.error:
+        magic = None
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a controller event stream")
+
+    offset = HEADER_SIZE
+    name = bytes(buf[offset : offset + name_length]).decode()
+    offset += name_length
+    axis_map = struct.unpack_from("<{}B".format(num_axes), buf, offset)
+    offset += num_axes
+    button_map = struct.unpack_from("<{}H".format(num_buttons), buf, offset)
+    offset += 2 * num_buttons
+    abs_ranges = {}
+    for _ in range(num_abs_ranges):
+        code, minimum, maximum = struct.unpack_from(ABS_RANGE_FORMAT, buf, offset)
+        abs_ranges[code] = (minimum, maximum)
+        offset += ABS_RANGE_SIZE
+    header = Header(
+        BACKENDS[backend],
+        bool(raw_mode),
+        record_size,
+        name,
+        axis_map,
+        button_map,
+        abs_ranges,
+    )
+    return header, offset
+
+
+class Recorder:
+    def __init__(self, controller, path):
+        self.controller = controller
+        self.records = 0
+        self._file = open(path, "wb")
+        self._file.write(pack_header(controller))
+        controller._taps += (self,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, data):
+        self._file.write(data)
+        self.records += len(data) // self.controller._record_size
+
+    def close(self):
+        self.controller._taps = tuple(
+            tap for tap in self.controller._taps if tap is not self
+        )
+        self._file.close()
+
+
+class Replayer:
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            header, self._offset = unpack_header(self._mmap)
+        except ValueError:
+            self.close()
+            raise ValueError("{} is not a controller recording".format(path))
+
+        self.backend = header.backend
+        self.raw_mode = header.raw_mode
+        self.record_size = header.record_size
+        self.name = header.name
+        self.axis_map = header.axis_map
+        self.button_map = header.button_map
+        self.abs_ranges = header.abs_ranges
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return (len(self._mmap) - self._offset) // self.record_size
+
+    def _batches(self, controller, realtime):
+        if controller.backend != self.backend or controller.raw_mode != self.raw_mode:
+            raise ValueError(
+                "recorded with backend={!r}, raw_mode={}".format(
+                    self.backend, self.raw_mode
+                )
+            )
+        if controller._record_size != self.record_size:
+            raise ValueError("recorded on a platform with a different event size")
+        if controller._evdev is not None:
+            # The values are scaled by the ranges of the replaying controller
+            for code, entry in controller._evdev._abs.items():
+                if self.abs_ranges.get(code, entry[5:7]) != entry[5:7]:
+                    raise ValueError("recorded with different axis ranges")
+
+        end = self._offset + len(self) * self.record_size
+        chunk = self.record_size * READ_BATCH_SIZE
+        with memoryview(self._mmap) as view:
+            for start in range(self._offset, end, chunk):
+                events = controller._decode(view[start : min(start + chunk, end)])
+                if not realtime:
+                    yield events
+                    continue
+
+                # Events happening at the same time were read together
+                batch = []
+                for event in events:
+                    if batch and event.time != batch[-1].time:
+                        yield batch
+                        batch = []
+                    batch.append(event)
+                if batch:
+                    yield batch
+
+    def replay(self, controller, realtime=True, speed=1.0):
+        start = None
+        for events in self._batches(controller, realtime):
+            if realtime:
+                if start is None:
+                    start = (time.monotonic(), events[0].time)
+                delay = (events[0].time - start[1]) / speed - (
+                    time.monotonic() - start[0]
+                )
+                if delay > 0:
+                    time.sleep(delay)
+            controller.process_events(events)
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
@@ -0,0 +1,481 @@
+"""Sharing the events of a controller with other local processes.
+
+An `EventServer` forwards the input events read from the device, exactly as
+they were read, to every client connected to a Unix domain socket. A
+`RemoteController` connects to it and works like an `Xbox360Controller`
+reading the device itself.
+
+A client sends a JSON line selecting the axes and buttons it wants, then the
+server sends the length of the stream header (see `record.pack_header`), the
+header, the length of the current state and the state, and the events from
+then on. The state is sent as events like the device would, joydev init
+events or a single evdev frame, with the last value of every axis and button
+the server saw an event of. Evdev axes are known from the start.
+"""
+
+import json
+import os
+import select
+import socket
+import struct
+import time
+import traceback
+from threading import Event, Lock, Thread
+
+from xbox360controller.controller import (
+    BOOT_TIME,
+    EVDEV,
+    JS_EVENT_FORMAT,
+    Xbox360Controller,
+)
+from xbox360controller.evdev import INPUT_EVENT_FORMAT
+from xbox360controller.linux.input_event_codes import (
+    EV_ABS,
+    EV_KEY,
+    EV_SYN,
+    SYN_DROPPED,
+    SYN_REPORT,
+)
+from xbox360controller.linux.joystick import (
+    JS_EVENT_AXIS,
+    JS_EVENT_BUTTON,
+    JS_EVENT_INIT,
+)
+from xbox360controller.record import pack_header, unpack_header
+from xbox360controller.wakeup import Waker
+
+# What to do when a client doesn't keep up and its buffer is full
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DISCONNECT = "disconnect"
+
+POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+# The longest subscription line accepted from a client
+MAX_REQUEST_SIZE = 4096
+
+
+class _Client:
+    __slots__ = ("socket", "request", "keys", "buffer", "protected", "skew")
+
+    def __init__(self, sock):
+        self.socket = sock
+        self.request = b""
+        # (type, number) of the events to send, None for all of them, or not
+        # subscribed yet
+        self.keys = False
+        self.buffer = bytearray()
+        # Bytes at the start of the buffer that can't be dropped: the rest of
+        # the header and of a partially sent event
+        self.protected = 0
+        self.skew = 0
+
+
+class EventServer:
+    def __init__(
+        self, controller, path, maxsize=64 * 1024, policy=DROP_OLDEST, timeout=None
+    ):
+        if policy not in POLICIES:
+            raise ValueError(
+                "policy must be one of {}".format(", ".join(map(repr, POLICIES)))
+            )
+
+        self.controller = controller
+        self.path = path
+        self.maxsize = maxsize
+        self.policy = policy
+        self.timeout = timeout
+        self.sent = 0
+        self.dropped = 0
+        self.disconnected = 0
+
+        self._record_size = controller._record_size
+        self._header = pack_header(controller)
+        # Tells evdev clients that events are missing, like the kernel does
+        # when its own buffer overflows
+        self._marker = b""
+        if controller._evdev is not None:
+            self._marker = struct.pack(INPUT_EVENT_FORMAT, 0, 0, EV_SYN, SYN_DROPPED, 0)
+        # The last value of every axis and button seen, by type and number,
+        # sent to new clients
+        self._values = {}
+        evdev = controller._evdev
+        if evdev is not None:
+            self._values[EV_ABS] = {
+                code: evdev._get_abs_info(code)[0] for code in evdev._abs
+            }
+            self._values[EV_KEY] = {}
+        else:
+            self._values[JS_EVENT_AXIS] = {}
+            self._values[JS_EVENT_BUTTON] = {}
+        self._clients = {}
+        self._lock = Lock()
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(path)
+        self._listener.listen()
+        self._listener.setblocking(False)
+        self._epoll = select.epoll()
+        self._epoll.register(self._listener.fileno(), select.EPOLLIN)
+        self._waker = Waker()
+        self._epoll.register(self._waker.fileno(), select.EPOLLIN)
+
+        self._stopped = Event()
+        self._thread = Thread(target=self._loop)
+        self._thread.start()
+        controller._taps += (self,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def clients(self):
+        return len(self._clients)
+
+    def _keys(self, axes, buttons):
+        # The events of the given axes and buttons, by (type, number)
+        if axes is None and buttons is None:
+            return None
+        return self.controller._event_keys(set(axes or ()) | set(buttons or ()))
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            try:
+                ready = self._epoll.poll(self.timeout)
+            except (OSError, ValueError):
+                # Closed in main thread
+                return
+            for fd, mask in ready:
+                try:
+                    if fd == self._waker.fileno():
+                        self._waker.clear()
+                    elif fd == self._listener.fileno():
+                        self._accept()
+                    elif mask & (select.EPOLLHUP | select.EPOLLERR):
+                        self._remove(fd)
+                    else:
+                        if mask & select.EPOLLIN:
+                            self._receive(fd)
+                        if mask & select.EPOLLOUT:
+                            with self._lock:
+                                client = self._clients.get(fd)
+                                if client is not None:
+                                    self._flush(fd, client)
+                except Exception:
+                    if self._stopped.is_set():
+                        return
+                    traceback.print_exc()
+
+    def _accept(self):
+        try:
+            sock, _ = self._listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        with self._lock:
+            self._clients[sock.fileno()] = _Client(sock)
+            self._epoll.register(sock.fileno(), select.EPOLLIN)
+
+    def _receive(self, fd):
+        with self._lock:
+            client = self._clients.get(fd)
+        if client is None:
+            return
+        try:
+            data = client.socket.recv(MAX_REQUEST_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            # The client went away
+            self._remove(fd)
+            return
+        if client.keys is not False:
+            return
+
+        client.request += data
+        if b"\n" not in client.request:
+            if len(client.request) > MAX_REQUEST_SIZE:
+                self._remove(fd)
+            return
+        try:
+            request = json.loads(client.request.split(b"\n", 1)[0])
+            keys = self._keys(request.get("axes"), request.get("buttons"))
+        except (ValueError, AttributeError):
+            self._remove(fd)
+            return
+
+        with self._lock:
+            state = self._state(keys)
+            header = (
+                struct.pack("<I", len(self._header))
+                + self._header
+                + struct.pack("<I", len(state))
+                + state
+            )
+            client.keys = keys
+            client.protected = len(header)
+            self._send(fd, client, header)
+
+    def _state(self, keys):
+        # Called holding the lock, so no events are missed or sent twice
+        now = time.time()
+        if self.controller._evdev is not None:
+            sec = int(now)
+            usec = int((now - sec) * 1000000)
+            records = [
+                struct.pack(INPUT_EVENT_FORMAT, sec, usec, type_, code, value)
+                for type_, values in self._values.items()
+                for code, value in values.items()
+                if keys is None or (type_, code) in keys
+            ]
+            records.append(
+                struct.pack(INPUT_EVENT_FORMAT, sec, usec, EV_SYN, SYN_REPORT, 0)
+            )
+            return b"".join(records)
+
+        time_ = round((now - BOOT_TIME) * 1000) & 0xFFFFFFFF
+        return b"".join(
+            struct.pack(JS_EVENT_FORMAT, time_, value, type_ | JS_EVENT_INIT, number)
+            for type_, values in self._values.items()
+            for number, value in values.items()
+            if keys is None or (type_, number) in keys
+        )
+
+    def _remove(self, fd):
+        with self._lock:
+            client = self._clients.get(fd)
+            if client is not None:
+                self._close_client(fd, client)
+
+    def write(self, data):
+        # Called with every read by the thread reading the device
+        with self._lock:
+            self._update(data)
+            if not self._clients:
+                return
+            events = None
+            for fd, client in list(self._clients.items()):
+                if client.keys is False:
+                    continue
+                if client.keys is None:
+                    payload = data
+                else:
+                    if events is None:
+                        events = self.controller._decode(data)
+                    payload = self._filter(data, events, client.keys)
+                    if not payload:
+                        continue
+                self._send(fd, client, payload)
+
+    def _update(self, data):
+        # Called holding the lock
+        values = self._values
+        if self.controller._evdev is not None:
+            abs_values = values[EV_ABS]
+            for _, _, type_, code, value in struct.iter_unpack(
+                INPUT_EVENT_FORMAT, data
+            ):
+                if type_ == EV_ABS:
+                    if code in abs_values:
+                        abs_values[code] = value
+                elif type_ == EV_KEY and value != 2:
+                    values[EV_KEY][code] = value
+            return
+
+        for _, value, type_, number in struct.iter_unpack(JS_EVENT_FORMAT, data):
+            type_ &= ~JS_EVENT_INIT
+            if type_ in values:
+                values[type_][number] = value
+
+    def _filter(self, data, events, keys):
+        size = self._record_size
+        return b"".join(
+            data[i * size : (i + 1) * size]
+            for i, event in enumerate(events)
+            if (event.type & ~JS_EVENT_INIT, event.number) in keys
+        )
+
+    def _send(self, fd, client, payload):
+        # Called holding the lock
+        buffer = client.buffer
+        if not buffer:
+            try:
+                sent = client.socket.send(payload)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                self._drop_client(fd, client)
+                return
+            self._sent(client, sent)
+            if sent == len(payload):
+                return
+            payload = payload[sent:]
+            self._epoll.modify(fd, select.EPOLLIN | select.EPOLLOUT)
+        elif len(buffer) + len(payload) > self.maxsize:
+            if self.policy == DISCONNECT:
+                self._drop_client(fd, client)
+                return
+            if self.policy == DROP_NEWEST:
+                self.dropped += len(payload) // self._record_size
+                self._dropped(client)
+                return
+            self._drop_oldest(client, len(buffer) + len(payload) - self.maxsize)
+        buffer += payload
+
+    def _sent(self, client, sent):
+        self.sent += sent
+        from_header = min(sent, client.protected)
+        client.protected -= from_header
+        client.skew = (client.skew + sent - from_header) % self._record_size
+
+    def _drop_oldest(self, client, excess):
+        size = self._record_size
+        buffer = client.buffer
+        start = client.protected + (size - client.skew) % size
+        marker = self._marker
+        if marker and buffer[start : start + size] == marker:
+            # Events were dropped here before, one marker is enough
+            start += size
+            marker = b""
+        records = min(-(-(excess + len(marker)) // size), (len(buffer) - start) // size)
+        if not records:
+            return
+        # The marker takes the place of the dropped events, so that the
+        # client throws away the frame they belonged to
+        buffer[start : start + records * size] = marker
+        self.dropped += records
+
+    def _dropped(self, client):
+        # The newest events were dropped, the marker goes after the others
+        marker = self._marker
+        if marker and not client.buffer.endswith(marker):
+            client.buffer += marker
+
+    def _flush(self, fd, client):
+        # Called holding the lock
+        try:
+            sent = client.socket.send(client.buffer)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._drop_client(fd, client)
+            return
+        self._sent(client, sent)
+        del client.buffer[:sent]
+        if not client.buffer:
+            self._epoll.modify(fd, select.EPOLLIN)
+
+    def _drop_client(self, fd, client):
+        # Called holding the lock
+        self.disconnected += 1
+        self._close_client(fd, client)
+
+    def _close_client(self, fd, client):
+        # Called holding the lock
+        del self._clients[fd]
+        try:
+            self._epoll.unregister(fd)
+        except (OSError, ValueError):
+            pass
+        client.socket.close()
+
+    def close(self):
+        self.controller._taps = tuple(
+            tap for tap in self.controller._taps if tap is not self
+        )
+        self._stopped.set()
+        self._waker.wake()
+        self._thread.join()
+        with self._lock:
+            for client in self._clients.values():
+                client.socket.close()
+            self._clients.clear()
+        self._epoll.close()
+        self._listener.close()
+        self._waker.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class RemoteController(Xbox360Controller):
+    def __init__(self, path, axes=None, buttons=None, **kwargs):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.connect(path)
+            request = {"axes": axes, "buttons": buttons}
+            self._socket.sendall(json.dumps(request).encode() + b"\n")
+            size = struct.unpack("<I", self._receive(4))[0]
+            self._header, _ = unpack_header(self._receive(size))
+            self._abs_ranges = self._header.abs_ranges
+            size = struct.unpack("<I", self._receive(4))[0]
+            self._initial_state = self._receive(size)
+        except Exception:
+            self._socket.close()
+            raise
+
+        stream = self._socket.makefile("rb", buffering=0)
+        if self._header.backend == EVDEV:
+            device, event_device = os.devnull, stream
+        else:
+            device, event_device = stream, os.devnull
+        super().__init__(
+            device=device,
+            event_device=event_device,
+            backend=self._header.backend,
+            raw_mode=self._header.raw_mode,
+            **kwargs
+        )
+
+    def _receive(self, size):
+        buf = bytearray()
+        while len(buf) < size:
+            data = self._socket.recv(size - len(buf))
+            if not data:
+                raise ConnectionError("the server closed the connection")
+            buf += data
+        return bytes(buf)
+
+    def _open_files(self):
+        # Only the stream is opened, the device belongs to the server
+        self._dev_file = self._open_device(self._device, None, "rb")
+        self._event_file = self._open_device(self._event_device, None, "wb")
+        self.effects.reset(self._event_file)
+        self._led_file = None
+        self.connected = True
+
+    def _open_input(self):
+        super()._open_input()
+        # Applied before the stream is read, so it's older than any event
+        events = self._decode(self._initial_state)
+        if self._evdev is None:
+            # Init events are skipped otherwise
+            events = [
+                event._replace(type=event.type & ~JS_EVENT_INIT, is_init=False)
+                for event in events
+            ]
+        self.process_events(events)
+
+    def _probe_capabilities(self):
+        capabilities = super()._probe_capabilities()
+        return capabilities._replace(
+            name=self._header.name,
+            axis_map=self._header.axis_map,
+            button_map=self._header.button_map,
+            has_rumble=False,
+            ff_effects=0,
+            has_led=False,
+        )
+
+    def reconnect(self):
+        raise RuntimeError("create a new RemoteController to connect again")
+
+    def close(self):
+        super().close()
+        self._socket.close()
@@ -0,0 +1,138 @@
+"""Sharing the state of a controller with other processes.
+
+A `StatePublisher` copies the state into a shared memory block on every
+update, guarded by a sequence counter (a seqlock): it is odd while the state
+is being written. A `StateReader` in another process copies the state and
+checks that the counter was even and didn't change meanwhile, or tries again.
+Neither side ever waits for the other or makes a syscall to read the state.
+"""
+
+import json
+import struct
+import sys
+from array import array
+from multiprocessing import shared_memory
+
+from xbox360controller.state import READERS, Snapshot
+
+MAGIC = b"X360SHM\0"
+VERSION = 1
+
+# magic, version, number of values, layout length, padding, sequence counter;
+# followed by the time and the values as doubles and the layout as JSON
+HEADER_FORMAT = "<8sIII4xQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+SEQUENCE_OFFSET = HEADER_SIZE - 8
+
+KINDS = {reader: kind for kind, reader in READERS.items()}
+
+
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    memory = shared_memory.SharedMemory(name)
+    # Otherwise the block is removed as soon as this process exits
+    from multiprocessing import resource_tracker
+
+    resource_tracker.unregister(memory._name, "shared_memory")
+    return memory
+
+
+class StatePublisher:
+    def __init__(self, controller, name=None):
+        self.controller = controller
+        state = controller._state
+        layout = json.dumps(
+            [
+                [key, index, KINDS[reader]]
+                for key, (index, reader) in state._layout.items()
+            ]
+        ).encode()
+        count = len(state.values)
+        data_size = 8 * (count + 1)
+        self._memory = shared_memory.SharedMemory(
+            name, create=True, size=HEADER_SIZE + data_size + len(layout)
+        )
+        self.name = self._memory.name
+        buf = self._memory.buf
+        struct.pack_into(HEADER_FORMAT, buf, 0, MAGIC, VERSION, count, len(layout), 0)
+        buf[HEADER_SIZE + data_size :] = layout
+        self._sequence = buf[SEQUENCE_OFFSET:HEADER_SIZE].cast("Q")
+        self._time = buf[HEADER_SIZE : HEADER_SIZE + 8].cast("d")
+        self._values = buf[HEADER_SIZE + 8 : HEADER_SIZE + data_size].cast("d")
+        self.write(state.values, state.time)
+        state.mirror = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, values, time):
+        # Called with every published state by the thread reading the device
+        sequence = self._sequence
+        sequence[0] += 1
+        self._time[0] = time
+        self._values[:] = values
+        sequence[0] += 1
+
+    def close(self):
+        state = self.controller._state
+        if state.mirror is self:
+            state.mirror = None
+        self._sequence.release()
+        self._time.release()
+        self._values.release()
+        self._memory.close()
+        self._memory.unlink()
+
+
+class StateReader:
+    def __init__(self, name, retries=10000):
+        self.name = name
+        self.retries = retries
+        self._memory = _attach(name)
+        buf = self._memory.buf
+        magic, version, count, layout_size, _ = struct.unpack_from(HEADER_FORMAT, buf)
+        if magic != MAGIC or version != VERSION:
+            self._memory.close()
+            raise ValueError("{} isn't a shared controller state".format(name))
+        data_end = HEADER_SIZE + 8 * (count + 1)
+        self._layout = {
+            key: (index, READERS[kind])
+            for key, index, kind in json.loads(
+                bytes(buf[data_end : data_end + layout_size])
+            )
+        }
+        self._sequence = buf[SEQUENCE_OFFSET:HEADER_SIZE].cast("Q")
+        self._data = buf[HEADER_SIZE:data_end]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def sequence(self):
+        """Increases with every update, to check whether anything changed."""
+        return self._sequence[0] // 2
+
+    def snapshot(self):
+        sequence = self._sequence
+        for _ in range(self.retries):
+            before = sequence[0]
+            if before % 2:
+                # Being written right now
+                continue
+            data = array("d")
+            data.frombytes(self._data)
+            if sequence[0] == before:
+                return Snapshot(self._layout, data[1:], data[0])
+        raise RuntimeError("the publisher didn't finish writing the state")
+
+    def close(self):
+        self._sequence.release()
+        self._data.release()
+        self._memory.close()
@@ -0,0 +1,115 @@
+"""Compact storage for the state of all axes and buttons of a controller.
+
+All values live in a single array of doubles. `Axis`, `RawAxis` and `Button`
+are views into it, and `StateStore.snapshot()` copies it in one go.
+"""
+
+from array import array
+
+
+def _read_value(values, index):
+    return values[index]
+
+
+def _read_pair(values, index):
+    return values[index], values[index + 1]
+
+
+def _read_int_pair(values, index):
+    return int(values[index]), int(values[index + 1])
+
+
+def _read_bool(values, index):
+    return bool(values[index])
+
+
+READERS = {
+    "value": _read_value,
+    "pair": _read_pair,
+    "int_pair": _read_int_pair,
+    "bool": _read_bool,
+}
+
+
+class StateStore:
+    __slots__ = ("values", "time", "mirror", "_layout", "_published")
+
+    def __init__(self):
+        self.values = array("d")
+        self.time = 0.0
+        # Gets every published state too, e.g. a StatePublisher
+        self.mirror = None
+        self._layout = {}
+        self._published = (self.values[:], self.time)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def names(self):
+        return list(self._layout)
+
+    def allocate(self, name, size, kind):
+        index = len(self.values)
+        self.values.extend([0.0] * size)
+        self._layout[name] = (index, READERS[kind])
+        self.publish()
+        return index
+
+    def publish(self):
+        # Copying the array is a single operation holding the GIL, and the
+        # tuple is swapped in with a single assignment, so readers never see
+        # a half-applied batch of events
+        self._published = (self.values[:], self.time)
+        if self.mirror is not None:
+            self.mirror.write(self.values, self.time)
+
+    def snapshot(self):
+        values, time = self._published
+        return Snapshot(self._layout, values, time)
+
+
+class Snapshot:
+    """Immutable copy of the state of all axes and buttons of a controller.
+
+    Axes are read as ``(x, y)`` tuples, triggers and raw axes as floats and
+    buttons as booleans, by attribute or by name: ``snapshot.axis_l`` or
+    ``snapshot["button_a"]``.
+    """
+
+    __slots__ = ("time", "_layout", "_values")
+
+    def __init__(self, layout, values, time):
+        object.__setattr__(self, "time", time)
+        object.__setattr__(self, "_layout", layout)
+        object.__setattr__(self, "_values", values)
+
+    def __repr__(self):
+        return "<xbox360controller.Snapshot ({})>".format(
+            ", ".join("{}={!r}".format(*item) for item in self.as_dict().items())
+        )
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __getitem__(self, name):
+        index, reader = self._layout[name]
+        return reader(self._values, index)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("snapshots are read-only")
+
+    def __iter__(self):
+        return iter(self._layout)
+
+    def __len__(self):
+        return len(self._layout)
+
+    def as_dict(self):
+        return {
+            name: reader(self._values, index)
+            for name, (index, reader) in self._layout.items()
+        }
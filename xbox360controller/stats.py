@@ -0,0 +1,117 @@
+"""Counting events and timing callbacks cheaply enough to always do it.
+
+Times are sorted into histograms with fixed, power of two sized buckets, so
+recording one is a couple of integer operations and never allocates. The
+percentiles are upper bounds of these buckets.
+"""
+
+import time
+from array import array
+from collections import namedtuple
+
+# Bucket i holds times below 2 ** i microseconds, the last one everything else
+BUCKETS = 32
+
+TraceRecord = namedtuple(
+    "TraceRecord", ["callback", "target", "event_time", "read_time", "start", "end"]
+)
+
+
+class Histogram:
+    __slots__ = ("counts",)
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * BUCKETS))
+
+    def add(self, seconds):
+        # Negative times land in the small buckets, as bit_length() ignores
+        # the sign
+        index = int(seconds * 1000000).bit_length()
+        self.counts[index if index < BUCKETS else BUCKETS - 1] += 1
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def percentile(self, percent):
+        """Return the upper bound of the bucket holding the given percentile."""
+        rank = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return 2**index / 1000000
+        return 0.0
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "buckets": {
+                2**index / 1000000: count
+                for index, count in enumerate(self.counts)
+                if count
+            },
+        }
+
+
+class Stats:
+    def __init__(self, slow_callback=0.005):
+        self.slow_callback = slow_callback
+        self.trace = None
+        # Whether events are timed from their kernel timestamps. joydev only
+        # has milliseconds since an estimated boot time, its events are timed
+        # from being read instead.
+        self.event_times = True
+        self.reset()
+
+    def reset(self):
+        self.events = 0
+        self.syscalls = 0
+        self.batches = 0
+        self.drops = 0
+        self.slow_calls = {}
+        self.last_read = 0.0
+        # From the kernel timestamp to reading the event and, when tracing,
+        # from the timestamp or the read to running its callback, and how
+        # long the callbacks ran
+        self.event_age = Histogram()
+        self.callback_latency = Histogram()
+        self.callback_duration = Histogram()
+
+    def read(self, count, first_time=None):
+        now = time.time()
+        self.last_read = now
+        self.batches += 1
+        self.events += count
+        if first_time is not None:
+            # The first event of a batch waited the longest
+            self.event_age.add(now - first_time)
+
+    def slow_call(self, callback, target, event_time, start, end):
+        # Only called for slow callbacks or when tracing, as timing every
+        # callback should stay cheap
+        if end - start > self.slow_callback:
+            name = getattr(callback, "__qualname__", None) or repr(callback)
+            self.slow_calls[name] = self.slow_calls.get(name, 0) + 1
+        if self.trace is not None:
+            self.callback_latency.add(
+                start - (event_time if self.event_times else self.last_read)
+            )
+            self.trace(
+                TraceRecord(callback, target, event_time, self.last_read, start, end)
+            )
+
+    def as_dict(self):
+        return {
+            "events": self.events,
+            "syscalls": self.syscalls,
+            "batches": self.batches,
+            "drops": self.drops,
+            "callbacks": self.callback_duration.count,
+            "slow_calls": dict(self.slow_calls),
+            "event_age": self.event_age.as_dict(),
+            "callback_latency": self.callback_latency.as_dict(),
+            "callback_duration": self.callback_duration.as_dict(),
+        }
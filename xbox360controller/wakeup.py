@@ -0,0 +1,56 @@
+"""Waking up a thread waiting for input in select() or epoll.
+
+The background threads watch a `Waker` alongside their files and sleep
+without a timeout, so an idle thread never wakes up, and stopping it only
+takes a write to the waker instead of waiting for a timeout to run out. An
+eventfd is used where available, a pipe otherwise.
+"""
+
+import os
+
+
+class Waker:
+    def __init__(self):
+        if hasattr(os, "eventfd"):
+            self._read_fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+            self._write_fd = self._read_fd
+        else:
+            self._read_fd, self._write_fd = os.pipe()
+            os.set_blocking(self._read_fd, False)
+            os.set_blocking(self._write_fd, False)
+
+    def fileno(self):
+        return self._read_fd
+
+    def wake(self):
+        if self._write_fd is None:
+            # Closed, nobody is waiting anymore
+            return
+        try:
+            if self._write_fd == self._read_fd:
+                os.eventfd_write(self._write_fd, 1)
+            else:
+                os.write(self._write_fd, b"\0")
+        except BlockingIOError:
+            # Plenty of wakeups pending already
+            pass
+
+    def clear(self):
+        if self._read_fd is None:
+            return
+        try:
+            if self._write_fd == self._read_fd:
+                os.eventfd_read(self._read_fd)
+            else:
+                while os.read(self._read_fd, 4096):
+                    pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        if self._read_fd is None:
+            return
+        os.close(self._read_fd)
+        if self._write_fd != self._read_fd:
+            os.close(self._write_fd)
+        self._read_fd = self._write_fd = None